@@ -0,0 +1,58 @@
+"""
+Micro-benchmark for displayable_rows() on a wide, 10,000 row result
+
+    python benchmarks/displayable_rows.py
+"""
+import datetime
+import decimal
+import timeit
+
+from django.conf import settings
+from psycopg2.extensions import Column
+
+settings.configure(SECRET_KEY="benchmark")
+
+from django_sql_dashboard.utils import displayable_rows  # noqa: E402
+
+NUM_ROWS = 10_000
+
+# name, type code, function returning a value for row i
+COLUMNS = [
+    ("id", 23, lambda i: i),
+    ("big_id", 20, lambda i: i * 1000),
+    ("name", 25, lambda i: "name {}".format(i)),
+    ("slug", 1043, lambda i: "slug-{}".format(i)),
+    ("price", 1700, lambda i: decimal.Decimal(i) / 100),
+    ("ratio", 701, lambda i: i / 7),
+    ("active", 16, lambda i: i % 2 == 0),
+    ("created", 1184, lambda i: datetime.datetime(2021, 1, 1)),
+    ("day", 1082, lambda i: datetime.date(2021, 1, 1)),
+    ("notes", 25, lambda i: None),
+    ("tags", 1009, lambda i: ["a", "b"] if i % 10 == 0 else None),
+    ("data", 3802, lambda i: {"i": i, "nested": [1, 2, 3]} if i % 10 == 0 else None),
+]
+
+
+def main():
+    description = [Column(name=name, type_code=oid) for name, oid, _ in COLUMNS]
+    names = [column.name for column in description]
+    type_codes = [column.type_code for column in description]
+    rows = [tuple(value(i) for _, _, value in COLUMNS) for i in range(NUM_ROWS)]
+    for label, kwargs in (
+        ("checking every column", {}),
+        ("using column type codes", {"type_codes": type_codes}),
+    ):
+        seconds = min(
+            timeit.repeat(
+                lambda: displayable_rows(rows, names, **kwargs), number=1, repeat=5
+            )
+        )
+        print(
+            "{} rows x {} columns, {}: {:.2f}ms".format(
+                NUM_ROWS, len(COLUMNS), label, seconds * 1000
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark for CSV exports of a synthetic 100,000 row table, comparing sending
+a chunk per row - as exports used to - with the default 64KB chunks
+
+    DATABASE_URL=postgres://localhost/mydb python benchmarks/export.py
+"""
+import csv
+import os
+import time
+from io import StringIO
+
+import dj_database_url
+import django
+from django.conf import settings
+
+settings.configure(
+    SECRET_KEY="benchmark",
+    DATABASES={
+        alias: dj_database_url.parse(os.environ["DATABASE_URL"])
+        for alias in ("default", "dashboard")
+    },
+    INSTALLED_APPS=[
+        "django.contrib.auth",
+        "django.contrib.contenttypes",
+        "django_sql_dashboard",
+    ],
+)
+django.setup()
+
+from django.db import connections  # noqa: E402
+from django.http import StreamingHttpResponse  # noqa: E402
+
+from django_sql_dashboard.views import (  # noqa: E402
+    fetch_batches,
+    stream_csv_export,
+)
+
+NUM_ROWS = 100_000
+
+CREATE_TABLE_SQL = """
+create temporary table export_benchmark as
+select
+  i as id,
+  'name ' || i as name,
+  i / 7.0 as ratio,
+  i % 2 = 0 as active,
+  timestamp '2021-01-01' + i * interval '1 minute' as created
+from generate_series(1, {}) as i
+""".format(
+    NUM_ROWS
+)
+
+
+def stream_csv_export_per_row(alias, sql, parameter_values, format):
+    "How exports used to work, yielding after every row"
+    csvfile = StringIO()
+    csvwriter = csv.writer(csvfile)
+
+    def read_and_flush():
+        csvfile.seek(0)
+        data = csvfile.read()
+        csvfile.seek(0)
+        csvfile.truncate()
+        return data
+
+    done_header = False
+    for description, records in fetch_batches(alias, sql, parameter_values):
+        if not done_header:
+            csvwriter.writerow([r.name for r in description])
+            yield read_and_flush()
+            done_header = True
+        for record in records:
+            csvwriter.writerow(record)
+            yield read_and_flush()
+
+
+def main():
+    # A temporary table lasts as long as the connection the export uses
+    with connections["dashboard"].cursor() as cursor:
+        cursor.execute(CREATE_TABLE_SQL)
+    for label, export in (
+        ("one chunk per row", stream_csv_export_per_row),
+        ("64KB chunks", stream_csv_export),
+    ):
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            num_chunks = 0
+            response = StreamingHttpResponse(
+                export("dashboard", "select * from export_benchmark", {}, "csv")
+            )
+            # A WSGI server writes each chunk to the socket separately
+            with open(os.devnull, "wb", buffering=0) as sink:
+                for chunk in response:
+                    sink.write(chunk)
+                    num_chunks += 1
+            timings.append(time.perf_counter() - start)
+        seconds = min(timings)
+        print(
+            "{} rows, {}: {:,.0f} rows/sec in {:,} chunks".format(
+                NUM_ROWS, label, NUM_ROWS / seconds, num_chunks
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
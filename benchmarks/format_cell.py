@@ -0,0 +1,51 @@
+"""
+Micro-benchmark for the format_cell filter on a 100 column, 1,000 row result
+
+    python benchmarks/format_cell.py
+"""
+import datetime
+import decimal
+import timeit
+
+from django.conf import settings
+
+settings.configure(SECRET_KEY="benchmark")
+
+from django_sql_dashboard.templatetags.django_sql_dashboard import (  # noqa: E402
+    format_cell,
+)
+
+NUM_ROWS = 1_000
+NUM_COLUMNS = 100
+
+# Functions returning a value for row i, repeated across the columns
+VALUES = [
+    lambda i: i,
+    lambda i: decimal.Decimal(i) / 100,
+    lambda i: datetime.datetime(2021, 1, 1) + datetime.timedelta(minutes=i),
+    lambda i: i % 2 == 0,
+    lambda i: "name {}".format(i),
+    lambda i: "A sentence about row {}. It has no links".format(i),
+    lambda i: "https://example.com/rows/{}".format(i),
+]
+
+
+def main():
+    rows = [
+        [VALUES[column % len(VALUES)](i) for column in range(NUM_COLUMNS)]
+        for i in range(NUM_ROWS)
+    ]
+
+    def format_rows():
+        for row in rows:
+            for value in row:
+                format_cell(value)
+
+    seconds = min(timeit.repeat(format_rows, number=1, repeat=3))
+    print(
+        "{} rows x {} columns: {:.2f}ms".format(NUM_ROWS, NUM_COLUMNS, seconds * 1000)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,2 @@
 urls = "django_sql_dashboard.urls"
+async_urls = "django_sql_dashboard.async_urls"
@@ -38,6 +38,14 @@ class DashboardAdmin(admin.ModelAdmin):
             "Permissions",
             {"fields": ("view_policy", "edit_policy", "view_group", "edit_group")},
         ),
+        (
+            "Caching",
+            {"fields": ("cache_ttl",)},
+        ),
+        (
+            "Timeouts",
+            {"fields": ("timeout_ms",)},
+        ),
     )
 
     def view_dashboard(self, obj):
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class DjangoSqlDashboardConfig(AppConfig):
     name = "django_sql_dashboard"
     default_auto_field = "django.db.models.AutoField"
+
+    def ready(self):
+        from .utils import warm_reserved_words
+
+        connection_created.connect(warm_reserved_words)
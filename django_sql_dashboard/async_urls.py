@@ -0,0 +1,40 @@
+from django.urls import path
+
+from .views import (
+    dashboard_async,
+    dashboard_index_async,
+    dashboard_json_async,
+    dashboard_query,
+    dashboard_query_json,
+    dashboard_running_queries,
+    dashboard_tables_json,
+)
+
+# The same URLs as urls.py, using async views where they are available
+urlpatterns = [
+    path("", dashboard_index_async, name="django_sql_dashboard-index"),
+    path(
+        "-/running/",
+        dashboard_running_queries,
+        name="django_sql_dashboard-running_queries",
+    ),
+    path(
+        "-/tables.json",
+        dashboard_tables_json,
+        name="django_sql_dashboard-tables",
+    ),
+    path("<slug>/", dashboard_async, name="django_sql_dashboard-dashboard"),
+    path(
+        "<slug>.json", dashboard_json_async, name="django_sql_dashboard-dashboard_json"
+    ),
+    path(
+        "<slug>/<int:index>/",
+        dashboard_query,
+        name="django_sql_dashboard-dashboard_query",
+    ),
+    path(
+        "<slug>/<int:index>.json",
+        dashboard_query_json,
+        name="django_sql_dashboard-dashboard_query_json",
+    ),
+]
@@ -0,0 +1,121 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from django_sql_dashboard.models import Dashboard
+from django_sql_dashboard.utils import extract_named_parameters
+from django_sql_dashboard.views import default_timeout_ms, execute_queries
+
+
+class Command(BaseCommand):
+    help = "Run the queries for saved dashboards and store their results in the cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "slugs",
+            nargs="*",
+            help="Dashboards to warm - defaults to every dashboard with a cache TTL",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help="Number of dashboards to warm at the same time",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=int,
+            help=(
+                "Statement timeout in milliseconds for each query, overriding "
+                "the timeouts configured for the dashboards"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        dashboards = Dashboard.objects.filter(cache_ttl__gt=0).prefetch_related(
+            "queries"
+        )
+        if options["slugs"]:
+            dashboards = dashboards.filter(slug__in=options["slugs"])
+            missing = set(options["slugs"]) - {d.slug for d in dashboards}
+            if missing:
+                raise CommandError(
+                    "No dashboards with a cache TTL found for: {}".format(
+                        ", ".join(sorted(missing))
+                    )
+                )
+        concurrency = max(options["concurrency"], 1)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            summaries = list(
+                executor.map(
+                    lambda dashboard: self.warm(dashboard, options["timeout"]),
+                    dashboards,
+                )
+            )
+        for slug, num_queries, errors, duration_ms in summaries:
+            self.stdout.write(
+                "{}: {} quer{}, {} error{}, {:.2f}ms".format(
+                    slug,
+                    num_queries,
+                    "y" if num_queries == 1 else "ies",
+                    errors,
+                    "" if errors == 1 else "s",
+                    duration_ms,
+                )
+            )
+        self.stdout.write(
+            "Warmed {} dashboard{} in {:.2f}ms".format(
+                len(summaries),
+                "" if len(summaries) == 1 else "s",
+                (time.perf_counter() - start) * 1000.0,
+            )
+        )
+
+    def warm(self, dashboard, timeout_ms):
+        alias = getattr(settings, "DASHBOARD_DB_ALIAS", "dashboard")
+        row_limit = getattr(settings, "DASHBOARD_ROW_LIMIT", None) or 100
+        # Match the SQL and parameter values used by the dashboard view when
+        # it is visited without any parameters in the query string
+        sqls = []
+        timeouts_ms = []
+        parameter_values = {}
+        for query in dashboard.queries.all():
+            sql = query.sql.strip().rstrip(";")
+            try:
+                parameters = extract_named_parameters(query.sql)
+            except ValueError:
+                continue
+            if ";" in sql:
+                continue
+            parameter_values.update({p: "" for p in parameters if p != "sql"})
+            sqls.append(sql)
+            timeouts_ms.append(
+                timeout_ms
+                or query.timeout_ms
+                or dashboard.timeout_ms
+                or default_timeout_ms()
+            )
+        start = time.perf_counter()
+        try:
+            outcomes = execute_queries(
+                alias,
+                sqls,
+                parameter_values,
+                row_limit,
+                cache_ttl=dashboard.cache_ttl,
+                refresh_cache=True,
+                timeout_ms=timeouts_ms,
+            )
+        finally:
+            connections[alias].close()
+        errors = len([o for o in outcomes if isinstance(o, Exception)])
+        return (
+            dashboard.slug,
+            len(sqls),
+            errors,
+            (time.perf_counter() - start) * 1000.0,
+        )
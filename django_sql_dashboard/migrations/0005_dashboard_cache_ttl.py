@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("django_sql_dashboard", "0004_add_description_help_text"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dashboard",
+            name="cache_ttl",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Cache query results for this many seconds",
+                null=True,
+            ),
+        ),
+    ]
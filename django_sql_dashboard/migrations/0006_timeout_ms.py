@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("django_sql_dashboard", "0005_dashboard_cache_ttl"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dashboard",
+            name="timeout_ms",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Default time limit for each query in milliseconds",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="dashboardquery",
+            name="timeout_ms",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Time limit for this query in milliseconds",
+                null=True,
+            ),
+        ),
+    ]
@@ -19,6 +19,16 @@ class Dashboard(models.Model):
         help_text="User who owns this dashboard",
     )
     created_at = models.DateTimeField(default=timezone.now)
+    cache_ttl = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Cache query results for this many seconds",
+    )
+    timeout_ms = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Default time limit for each query in milliseconds",
+    )
 
     class ViewPolicies(models.TextChoices):
         PRIVATE = ("private", "Private")
@@ -146,6 +156,11 @@ class DashboardQuery(models.Model):
         Dashboard, related_name="queries", on_delete=models.CASCADE
     )
     sql = models.TextField()
+    timeout_ms = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Time limit for this query in milliseconds",
+    )
 
     def __str__(self):
         return self.sql
@@ -1,13 +1,20 @@
 import csv
+import hashlib
 import io
 import json
+import re
+import threading
+from functools import lru_cache
 
 import bleach
 import markdown
 from django import template
+from django.conf import settings
+from django.core.cache import cache
 from django.utils.html import escape, urlize
 from django.utils.safestring import mark_safe
 
+from ..utils import JSONCell, QueryResult
 from ..utils import sign_sql as sign_sql_original
 
 TAGS = [
@@ -43,32 +50,125 @@ def sign_sql(value):
     return sign_sql_original(value)
 
 
+# Variables from the page that the bundled widget templates use
+WIDGET_CONTEXT_VARIABLES = (
+    "saved_dashboard",
+    "user_can_execute_sql",
+    "user_can_export_data",
+    "too_long_so_use_post",
+    "export_formats",
+)
+
+
+# The parts of a result that the widget cache key is built from. Timings such
+# as duration_ms and computed_at change every time a query runs, so are left out
+WIDGET_CACHE_KEY_RESULT_KEYS = (
+    "templates",
+    "columns",
+    "sql",
+    "index",
+    "truncated",
+    "row_offset",
+    "next_page_url",
+    "first_page_url",
+    "render_in_browser",
+    "extra_qs",
+    "textarea_rows",
+)
+
+
+def _cache_key_cell(value):
+    # The repr() of a memoryview includes its address in memory
+    if isinstance(value, (memoryview, bytes)):
+        return bytes(value).hex()
+    return value
+
+
+def _widget_cache_key(template_name, result, context):
+    digest = hashlib.sha256()
+    for value in (
+        template_name,
+        [result.get(key) for key in WIDGET_CACHE_KEY_RESULT_KEYS],
+        [context.get(name) for name in WIDGET_CONTEXT_VARIABLES],
+        # For the "Run query" or "Run queries" button
+        len(context.get("query_results") or ()) > 1,
+        [
+            [_cache_key_cell(value) for value in row.values]
+            for row in result["row_lists"]
+        ],
+    ):
+        digest.update(repr(value).encode("utf-8"))
+    return "django_sql_dashboard:widget:{}".format(digest.hexdigest())
+
+
+@register.simple_tag(takes_context=True)
+def sql_dashboard_widget(context, result):
+    """
+    Renders the first of result.templates that exists, like {% include %}.
+
+    If DASHBOARD_WIDGET_CACHE_TTL is set the HTML for query results is cached,
+    keyed by a digest of the template name, the result and its rows.
+    """
+    widget = context.template.engine.select_template(result["templates"])
+    ttl = getattr(settings, "DASHBOARD_WIDGET_CACHE_TTL", None)
+    cache_key = None
+    if ttl and isinstance(result, QueryResult):
+        cache_key = _widget_cache_key(widget.origin.name, result, context)
+        html = cache.get(cache_key)
+        if html is not None:
+            return mark_safe(html)
+    with context.push(result=result):
+        html = widget.render(context)
+    if cache_key:
+        cache.set(cache_key, str(html), ttl)
+    return html
+
+
+# Sanitized HTML is cached for this many distinct inputs, as descriptions and
+# markdown or html widget values are usually rendered over and over again
+MARKUP_CACHE_SIZE = 1024
+
+_local = threading.local()
+
+
+def _thread_local(name, factory):
+    # Cleaner, Linker and Markdown instances are not thread-safe, so each
+    # thread builds its own the first time it needs one
+    instance = getattr(_local, name, None)
+    if instance is None:
+        instance = factory()
+        setattr(_local, name, instance)
+    return instance
+
+
+def _cleaner():
+    return _thread_local(
+        "cleaner", lambda: bleach.Cleaner(tags=TAGS, attributes=ATTRIBUTES)
+    )
+
+
+@lru_cache(maxsize=MARKUP_CACHE_SIZE)
+def _bleach(value):
+    return _cleaner().clean(value)
+
+
+@lru_cache(maxsize=MARKUP_CACHE_SIZE)
+def _markdown(value):
+    converter = _thread_local(
+        "markdown", lambda: markdown.Markdown(output_format="html5")
+    )
+    linker = _thread_local("linker", bleach.Linker)
+    return linker.linkify(_cleaner().clean(converter.reset().convert(value)))
+
+
 @register.filter
 def sql_dashboard_bleach(value):
-    return mark_safe(
-        bleach.clean(
-            value,
-            tags=TAGS,
-            attributes=ATTRIBUTES,
-        )
-    )
+    return mark_safe(_bleach(value))
 
 
 @register.filter
 def sql_dashboard_markdown(value):
-    value = value or ""
-    return mark_safe(
-        bleach.linkify(
-            bleach.clean(
-                markdown.markdown(
-                    value,
-                    output_format="html5",
-                ),
-                tags=TAGS,
-                attributes=ATTRIBUTES,
-            )
-        )
-    )
+    return mark_safe(_markdown(value or ""))
 
 
 @register.filter
@@ -81,9 +181,38 @@ def sql_dashboard_tsv(result):
     return writer.getvalue().strip()
 
 
+@register.filter
+def sql_dashboard_client_rows(result):
+    # Cells are sent as the strings the server would have displayed, which
+    # is also what the TSV copy area needs
+    return {
+        "columns": result["columns"],
+        "rows": [
+            [None if cell is None else str(cell) for cell in row]
+            for row in result["row_lists"]
+        ],
+    }
+
+
+# Matches anything that urlize() might turn into a link - URLs, www. and bare
+# domains with the top level domains it recognizes, and email addresses
+_possible_link_re = re.compile(
+    r"https?://|www\.|@|\.(com|edu|gov|int|mil|net|org)\b", re.IGNORECASE
+)
+
+
 @register.filter
 def format_cell(value):
-    if isinstance(value, str) and value and value[0] in ("{", "["):
+    if isinstance(value, JSONCell):
+        return mark_safe(
+            '<pre class="json">{}</pre>'.format(
+                escape(json.dumps(value.value, indent=2, default=str))
+            )
+        )
+    if not isinstance(value, str):
+        # Numbers, dates and other types cannot hold JSON or links
+        return escape(value)
+    if value[:1] in ("{", "["):
         try:
             return mark_safe(
                 '<pre class="json">{}</pre>'.format(
@@ -92,4 +221,6 @@ def format_cell(value):
             )
         except json.JSONDecodeError:
             pass
+    if not _possible_link_re.search(value):
+        return escape(value)
     return mark_safe(urlize(value, nofollow=True, autoescape=True))
@@ -1,9 +1,37 @@
 from django.urls import path
 
-from .views import dashboard, dashboard_json, dashboard_index
+from .views import (
+    dashboard,
+    dashboard_index,
+    dashboard_json,
+    dashboard_query,
+    dashboard_query_json,
+    dashboard_running_queries,
+    dashboard_tables_json,
+)
 
 urlpatterns = [
     path("", dashboard_index, name="django_sql_dashboard-index"),
+    path(
+        "-/running/",
+        dashboard_running_queries,
+        name="django_sql_dashboard-running_queries",
+    ),
+    path(
+        "-/tables.json",
+        dashboard_tables_json,
+        name="django_sql_dashboard-tables",
+    ),
     path("<slug>/", dashboard, name="django_sql_dashboard-dashboard"),
     path("<slug>.json", dashboard_json, name="django_sql_dashboard-dashboard_json"),
+    path(
+        "<slug>/<int:index>/",
+        dashboard_query,
+        name="django_sql_dashboard-dashboard_query",
+    ),
+    path(
+        "<slug>/<int:index>.json",
+        dashboard_query_json,
+        name="django_sql_dashboard-dashboard_query_json",
+    ),
 ]
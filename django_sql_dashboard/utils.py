@@ -1,10 +1,24 @@
 import binascii
+import hashlib
 import json
+import math
 import re
+import threading
 import urllib.parse
 from collections import namedtuple
+from concurrent.futures import Future
+from decimal import Decimal
 
+from django.conf import settings
 from django.core import signing
+from django.core.cache import cache
+from django.db.utils import DatabaseError
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
 
 SQL_SALT = "django_sql_dashboard:query"
 
@@ -30,31 +44,170 @@ def unsign_sql(signed_sql, try_object=False):
             return signed_sql, False
 
 
+PAGE_SALT = "django_sql_dashboard:page"
+
+
+def sign_page_token(offset):
+    return signing.dumps(offset, salt=PAGE_SALT)
+
+
+def unsign_page_token(token):
+    # Returns the offset, raising BadSignature for tampered tokens
+    offset = signing.loads(token, salt=PAGE_SALT)
+    if not isinstance(offset, int) or offset < 0:
+        raise signing.BadSignature("Invalid page token")
+    return offset
+
+
+class SingleFlight:
+    "Coalesces concurrent calls that share a key into a single call"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = Future()
+        if not is_leader:
+            # Raises the exception if the leading call failed
+            return call.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+def column_indexes(columns):
+    # Maps column names to their index - later columns win for duplicate
+    # names, as they would for dict(zip(columns, values))
+    return {column: index for index, column in enumerate(columns)}
+
+
 class Row:
+    "A row of results that can be accessed by column index or by column name"
+
+    __slots__ = ("values", "columns")
+
     def __init__(self, values, columns):
+        # Pass the same column_indexes() dictionary for every row in a result
+        # to avoid building one per row
+        if not isinstance(columns, dict):
+            columns = column_indexes(columns)
         self.values = values
         self.columns = columns
-        self.zipped = dict(zip(columns, values))
 
     def __getitem__(self, key):
-        if isinstance(key, int):
+        if isinstance(key, (int, slice)):
             return self.values[key]
         else:
-            return self.zipped[key]
+            return self.values[self.columns[key]]
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def keys(self):
+        return self.columns.keys()
+
+    def items(self):
+        return [(column, self.values[index]) for column, index in self.columns.items()]
+
+    def as_dict(self):
+        return dict(self.items())
 
     def __repr__(self):
-        return json.dumps(self.zipped)
+        return json.dumps(self.as_dict(), default=str)
 
 
-def displayable_rows(rows):
+class QueryResult(dict):
+    "The result of a query for templates, which builds result.rows when used"
+
+    def __missing__(self, key):
+        if key != "rows":
+            raise KeyError(key)
+        rows = self["rows"] = [row.as_dict() for row in self["row_lists"]]
+        return rows
+
+
+class JSONCell(str):
+    "A dict or list value serialized as JSON, which keeps the original value"
+
+    def __new__(cls, value):
+        cell = super().__new__(cls, json.dumps(value, default=str))
+        cell.value = value
+        return cell
+
+
+# Type codes of columns that psycopg2 never returns as a dict or a list
+SCALAR_TYPE_CODES = frozenset(
+    (
+        16,  # bool
+        17,  # bytea
+        18,  # "char"
+        19,  # name
+        20,  # int8
+        21,  # int2
+        23,  # int4
+        25,  # text
+        26,  # oid
+        650,  # cidr
+        700,  # float4
+        701,  # float8
+        705,  # unknown
+        790,  # money
+        869,  # inet
+        1042,  # bpchar
+        1043,  # varchar
+        1082,  # date
+        1083,  # time
+        1114,  # timestamp
+        1184,  # timestamptz
+        1186,  # interval
+        1266,  # timetz
+        1700,  # numeric
+        2950,  # uuid
+    )
+)
+
+
+def displayable_rows(rows, columns, type_codes=None):
+    """
+    Converts dict and list values - from JSON and array columns - to JSONCell
+    strings. Pass the type_code of each column from cursor.description to
+    skip checking the values of columns that cannot hold them.
+    """
+    indexes = column_indexes(columns)
+    check = [
+        index
+        for index in range(len(columns))
+        if type_codes is None or type_codes[index] not in SCALAR_TYPE_CODES
+    ]
+    if not check:
+        return [Row(row, indexes) for row in rows]
     fixed = []
     for row in rows:
-        fixed_row = []
-        for cell in row:
+        # Rows are only copied if they have cells that need converting
+        converted = None
+        for index in check:
+            cell = row[index]
             if isinstance(cell, (dict, list)):
-                cell = json.dumps(cell, default=str)
-            fixed_row.append(cell)
-        fixed.append(fixed_row)
+                if converted is None:
+                    converted = list(row)
+                converted[index] = JSONCell(cell)
+        fixed.append(Row(row if converted is None else converted, indexes))
     return fixed
 
 
@@ -95,19 +248,126 @@ def is_valid_base64_json(s):
         return False
 
 
-_reserved_words = None
+# Maps (alias, server version) to a frozenset of reserved words
+_reserved_words = {}
 
 
 def postgresql_reserved_words(connection):
-    global _reserved_words
-    if _reserved_words is None:
+    key = (connection.alias, connection.pg_version)
+    reserved_words = _reserved_words.get(key)
+    if reserved_words is None:
         with connection.cursor() as cursor:
             cursor.execute("select word from pg_get_keywords() where catcode = 'R'")
-            _reserved_words = [row[0] for row in cursor.fetchall()]
-    return _reserved_words
+            reserved_words = frozenset(row[0] for row in cursor.fetchall())
+        _reserved_words[key] = reserved_words
+    return reserved_words
+
 
+def warm_reserved_words(sender, connection, **kwargs):
+    "connection_created handler that looks up reserved words for new servers"
+    alias = getattr(settings, "DASHBOARD_DB_ALIAS", "dashboard")
+    if connection.alias != alias or connection.vendor != "postgresql":
+        return
+    try:
+        postgresql_reserved_words(connection)
+    except DatabaseError:
+        # Looked up again the first time they are needed
+        pass
 
-_sort_re = re.compile('(^.*) order by "[^"]+"( desc)?$', re.DOTALL)
+
+_schema_fingerprint_sql = """
+with public_relations as (
+  select oid, relnatts, xmin
+  from pg_class
+  where
+    relnamespace = 'public'::regnamespace
+    and relkind in ('r', 'v', 'm', 'f', 'p')
+)
+select
+  (select count(*) from public_relations),
+  (select coalesce(sum(relnatts), 0) from public_relations),
+  (select coalesce(max(xmin::text::bigint), 0) from public_relations),
+  md5(
+    coalesce(
+      string_agg(
+        attrelid::text || ':' || attname, ',' order by attrelid, attnum
+      ),
+      ''
+    )
+  )
+from
+  pg_attribute
+where
+  attrelid in (select oid from public_relations)
+  and attnum > 0
+  and not attisdropped
+"""
+
+_available_tables_sql = """
+with visible_tables as (
+  select table_name
+    from information_schema.tables
+    where table_schema = 'public'
+    order by table_name
+)
+select
+  information_schema.columns.table_name,
+  array_to_json(array_agg(cast(column_name as text) order by ordinal_position)) as columns
+from
+  information_schema.columns
+join
+  visible_tables on
+  information_schema.columns.table_name = visible_tables.table_name
+where
+  information_schema.columns.table_schema = 'public'
+group by
+  information_schema.columns.table_name
+order by
+  information_schema.columns.table_name
+"""
+
+
+def schema_fingerprint(connection):
+    # Cheap summary of pg_class and pg_attribute that changes when tables
+    # or columns in the public schema are added, dropped or renamed
+    with connection.cursor() as cursor:
+        cursor.execute(_schema_fingerprint_sql)
+        return "-".join(str(value) for value in cursor.fetchone())
+
+
+def available_tables(connection, fingerprint=None):
+    # Pass fingerprint if schema_fingerprint() has already been called
+    ttl = getattr(settings, "DASHBOARD_SCHEMA_CACHE_TTL", 300)
+    cache_key = None
+    if ttl:
+        cache_key = "django_sql_dashboard:tables:{}:{}".format(
+            connection.alias, fingerprint or schema_fingerprint(connection)
+        )
+        tables = cache.get(cache_key)
+        if tables is not None:
+            return tables
+    reserved_words = postgresql_reserved_words(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(_available_tables_sql)
+        tables = [
+            {
+                "name": row[0],
+                "columns": ", ".join(row[1]),
+                "sql_columns": ", ".join(
+                    [
+                        '"{}"'.format(column) if column in reserved_words else column
+                        for column in row[1]
+                    ]
+                ),
+            }
+            for row in cursor.fetchall()
+        ]
+    if cache_key:
+        cache.set(cache_key, tables, ttl)
+    return tables
+
+
+_sort_re = re.compile('(^.*) order by "([^"]+)"( desc)?$', re.DOTALL)
 
 
 def apply_sort(sql, sort_column, is_desc=False):
@@ -117,3 +377,261 @@ def apply_sort(sql, sort_column, is_desc=False):
     else:
         sql = "select * from ({}) as results".format(sql)
     return sql + ' order by "{}"{}'.format(sort_column, " desc" if is_desc else "")
+
+
+def limit_sql(sql, limit):
+    # The newline ends any -- comment on the last line of the query
+    return "select * from ({}\n) as results limit {}".format(sql, int(limit))
+
+
+NEXT_PAGE_SALT = "django_sql_dashboard:next-page"
+
+
+def _next_page_salt(sql):
+    # Tokens are only valid for the query they were created for
+    return "{}:{}".format(
+        NEXT_PAGE_SALT, hashlib.sha256(sql.encode("utf-8")).hexdigest()
+    )
+
+
+def sign_next_page(sql, page):
+    return signing.dumps(page, salt=_next_page_salt(sql))
+
+
+def unsign_next_page(sql, token):
+    # Returns the page created by next_page(), raising BadSignature for
+    # tampered tokens or tokens that belong to a different query
+    page = signing.loads(token, salt=_next_page_salt(sql))
+    if (
+        not isinstance(page, dict)
+        or not isinstance(page.get("offset"), int)
+        or page["offset"] < 0
+        or not isinstance(page.get("ties", 0), int)
+        or page.get("ties", 0) < 0
+    ):
+        raise signing.BadSignature("Invalid page token")
+    return page
+
+
+# Type codes of columns whose values can be passed back to PostgreSQL as a
+# string or number and compared with the column to find the next page
+KEYSET_TYPE_CODES = frozenset(
+    (
+        16,  # bool
+        20,  # int8
+        21,  # int2
+        23,  # int4
+        25,  # text
+        700,  # float4
+        701,  # float8
+        1042,  # bpchar
+        1043,  # varchar
+        1082,  # date
+        1083,  # time
+        1114,  # timestamp
+        1184,  # timestamptz
+        1266,  # timetz
+        1700,  # numeric
+        2950,  # uuid
+    )
+)
+
+
+def _page_key(value):
+    # Dates, times, decimals and UUIDs are cast back from their string form
+    if isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def _is_finite(value):
+    if isinstance(value, Decimal):
+        return value.is_finite()
+    return math.isfinite(value)
+
+
+def next_page(sql, page, columns, type_codes, rows):
+    """
+    Returns the page that follows rows, which were fetched from sql starting
+    at page - an {"offset": ...} dictionary, or None for the first page.
+
+    Queries sorted using apply_sort() by a column with one of the
+    KEYSET_TYPE_CODES also record the last value of the sort column and how
+    many rows have been seen with that value, so the next page can be found
+    using that column instead of skipping past every earlier row.
+    """
+    page = page or {"offset": 0}
+    offset = page["offset"] + len(rows)
+    match = _sort_re.match(sql)
+    if match is None or not rows or columns.count(match.group(2)) != 1:
+        return {"offset": offset}
+    index = columns.index(match.group(2))
+    last = rows[-1][index]
+    if (
+        last is None
+        or type_codes[index] not in KEYSET_TYPE_CODES
+        # PostgreSQL sorts NaN after every other value, so a NaN key would
+        # only match the NaN rows again
+        or (isinstance(last, (float, Decimal)) and not _is_finite(last))
+    ):
+        return {"offset": offset}
+    ties = 0
+    for row in reversed(rows):
+        if row[index] != last:
+            break
+        ties += 1
+    key = _page_key(last)
+    if ties == len(rows) and page.get("key") == key:
+        ties += page["ties"]
+    return {"offset": offset, "key": key, "ties": ties}
+
+
+def paginate_sql(sql, page, limit, key_parameter):
+    """
+    Returns (sql, parameters) for fetching up to limit rows of sql starting at
+    a page returned by next_page(), with the sort column value passed as the
+    key_parameter named parameter
+    """
+    match = _sort_re.match(sql)
+    if match is not None and "key" in page:
+        sorted_sql, column, is_desc = match.groups()
+        if is_desc:
+            condition = '"{0}" <= %({1})s'
+        else:
+            # Ascending order puts nulls last, so they are still to come
+            condition = '("{0}" >= %({1})s or "{0}" is null)'
+        return (
+            'select * from ({}\n) as results where {} order by "{}"{} '
+            "limit {} offset {}".format(
+                sorted_sql,
+                condition.format(column, key_parameter),
+                column,
+                is_desc or "",
+                int(limit),
+                page["ties"],
+            ),
+            {key_parameter: page["key"]},
+        )
+    # As in limit_sql(), the newline ends a trailing -- comment
+    return (
+        "select * from ({}\n) as results limit {} offset {}".format(
+            sql, int(limit), page["offset"]
+        ),
+        {},
+    )
+
+
+def json_default(o):
+    return o.isoformat() if hasattr(o, "isoformat") else str(o)
+
+
+def finite_or_none(value):
+    # JSON has no NaN or Infinity, so non-finite floats are written as null
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, list):
+        return [finite_or_none(item) for item in value]
+    return value
+
+
+def _json_dumps_cell(value):
+    if value is None:
+        return None
+    return json.dumps(value, default=json_default)
+
+
+def _str_cell(value):
+    return None if value is None else str(value)
+
+
+def _bytes_cell(value):
+    return None if value is None else bytes(value)
+
+
+def _decimal_cell(value):
+    # Arrow decimals cannot hold NaN or infinity
+    return value if value is not None and value.is_finite() else None
+
+
+# OIDs of arrays of built-in types, which psycopg2 returns as Python lists
+ARRAY_TYPE_CODES = frozenset(
+    (
+        199,  # json[]
+        1000,  # bool[]
+        1005,  # int2[]
+        1007,  # int4[]
+        1009,  # text[]
+        1014,  # bpchar[]
+        1015,  # varchar[]
+        1016,  # int8[]
+        1021,  # float4[]
+        1022,  # float8[]
+        1028,  # oid[]
+        1115,  # timestamp[]
+        1182,  # date[]
+        1183,  # time[]
+        1185,  # timestamptz[]
+        1187,  # interval[]
+        1231,  # numeric[]
+        2951,  # uuid[]
+        3807,  # jsonb[]
+    )
+)
+
+
+def _arrow_type_and_converter(column):
+    # Maps PostgreSQL type OIDs to Arrow types, plus a function for converting
+    # the values returned by psycopg2 if they need it
+    type_code = column.type_code
+    simple_types = {
+        16: pyarrow.bool_(),
+        20: pyarrow.int64(),
+        21: pyarrow.int16(),
+        23: pyarrow.int32(),
+        26: pyarrow.int64(),
+        700: pyarrow.float32(),
+        701: pyarrow.float64(),
+        19: pyarrow.string(),
+        25: pyarrow.string(),
+        1042: pyarrow.string(),
+        1043: pyarrow.string(),
+        1082: pyarrow.date32(),
+        1083: pyarrow.time64("us"),
+        1114: pyarrow.timestamp("us"),
+        1184: pyarrow.timestamp("us", tz="UTC"),
+        1186: pyarrow.duration("us"),
+    }
+    if type_code in simple_types:
+        return simple_types[type_code], None
+    if type_code == 17:
+        return pyarrow.binary(), _bytes_cell
+    if type_code == 1700 and column.precision and column.precision <= 38:
+        return pyarrow.decimal128(column.precision, column.scale or 0), _decimal_cell
+    if type_code in (114, 3802) or type_code in ARRAY_TYPE_CODES:
+        return pyarrow.string(), _json_dumps_cell
+    # Unconstrained numeric, uuid and anything else
+    return pyarrow.string(), _str_cell
+
+
+def arrow_schema(description):
+    """
+    Returns an Arrow schema for a cursor description, plus a list of converter
+    functions (or None) for the values in each column
+    """
+    fields = []
+    converters = []
+    for column in description:
+        arrow_type, converter = _arrow_type_and_converter(column)
+        fields.append(pyarrow.field(column.name, arrow_type))
+        converters.append(converter)
+    return pyarrow.schema(fields), converters
+
+
+def arrow_record_batch(schema, converters, rows):
+    arrays = []
+    for i, (field, converter) in enumerate(zip(schema, converters)):
+        values = [row[i] for row in rows]
+        if converter is not None:
+            values = [converter(value) for value in values]
+        arrays.append(pyarrow.array(values, type=field.type))
+    return pyarrow.record_batch(arrays, schema=schema)
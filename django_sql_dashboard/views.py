@@ -1,34 +1,71 @@
+import asyncio
 import csv
 import hashlib
+import itertools
+import json
+import queue
 import re
+import threading
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager, nullcontext
+from datetime import timedelta
 from io import StringIO
 from urllib.parse import urlencode
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
+from django.core import signing
+from django.core.cache import cache
 from django.db import connections
-from django.db.utils import ProgrammingError
+from django.db.utils import (
+    DatabaseError,
+    NotSupportedError,
+    OperationalError,
+    ProgrammingError,
+)
 from django.forms import CharField, ModelForm, Textarea
+from django.http import Http404
 from django.http.response import (
+    HttpResponseBadRequest,
     HttpResponseForbidden,
     HttpResponseRedirect,
     JsonResponse,
     StreamingHttpResponse,
 )
 from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.utils.safestring import mark_safe
 
 from psycopg2.extensions import quote_ident
 
 from .models import Dashboard
 from .utils import (
+    QueryResult,
+    SingleFlight,
     apply_sort,
+    arrow_record_batch,
+    arrow_schema,
+    available_tables,
     check_for_base64_upgrade,
     displayable_rows,
     extract_named_parameters,
-    postgresql_reserved_words,
+    finite_or_none,
+    json_default,
+    limit_sql,
+    next_page,
+    paginate_sql,
+    pyarrow,
+    sign_next_page,
+    sign_page_token,
     sign_sql,
+    unsign_next_page,
+    unsign_page_token,
     unsign_sql,
 )
 
@@ -108,13 +145,8 @@ def dashboard_index(request):
             return HttpResponseRedirect(redirect_path)
         else:
             sql_queries = sqls
-    unverified_sql_queries = []
-    for signed_sql in request.GET.getlist("sql"):
-        sql, signature_verified = unsign_sql(signed_sql)
-        if signature_verified:
-            sql_queries.append(sql)
-        else:
-            unverified_sql_queries.append(sql)
+    verified_sql_queries, unverified_sql_queries = _unsign_sql_queries(request)
+    sql_queries.extend(verified_sql_queries)
     if getattr(settings, "DASHBOARD_UPGRADE_OLD_BASE64_LINKS", None):
         redirect_querystring = check_for_base64_upgrade(sql_queries)
         if redirect_querystring:
@@ -128,7 +160,88 @@ def dashboard_index(request):
     )
 
 
-def _dashboard_index(
+async def dashboard_index_async(request):
+    """
+    Async version of dashboard_index(), which executes the queries for GET
+    requests concurrently. POST requests are handled by dashboard_index().
+    """
+    if request.method == "POST":
+        return await sync_to_async(dashboard_index)(request)
+    # request.auser() and ahas_perm() need Django 5.0
+    is_authenticated, has_perm = await sync_to_async(
+        lambda: (
+            request.user.is_authenticated,
+            request.user.has_perm("django_sql_dashboard.execute_sql"),
+        )
+    )()
+    if not is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    if not has_perm:
+        return HttpResponseForbidden("You do not have permission to execute SQL")
+    sql_queries, unverified_sql_queries = _unsign_sql_queries(request)
+    if getattr(settings, "DASHBOARD_UPGRADE_OLD_BASE64_LINKS", None):
+        redirect_querystring = check_for_base64_upgrade(sql_queries)
+        if redirect_querystring:
+            return HttpResponseRedirect(request.path + redirect_querystring)
+    return await _dashboard_index_async(
+        request,
+        sql_queries,
+        unverified_sql_queries=unverified_sql_queries,
+        extra_context={"save_form": SaveDashboardForm(prefix="_save")},
+    )
+
+
+def _unsign_sql_queries(request):
+    "Returns (verified, unverified) lists of the SQL queries in ?sql="
+    verified_sql_queries = []
+    unverified_sql_queries = []
+    for signed_sql in request.GET.getlist("sql"):
+        sql, signature_verified = unsign_sql(signed_sql)
+        if signature_verified:
+            verified_sql_queries.append(sql)
+        else:
+            unverified_sql_queries.append(sql)
+    return verified_sql_queries, unverified_sql_queries
+
+
+def _dashboard_index(request, *args, **kwargs):
+    """
+    Executes the queries and renders the results.
+
+    If deferred_results_url is provided, queries are not executed - each one
+    is rendered as a placeholder which loads its results from that URL
+    (a function taking the index of the query) once the page has loaded.
+    """
+    steps = _dashboard_index_steps(request, *args, **kwargs)
+    outcomes = None
+    while True:
+        done, value = _advance_steps(steps, outcomes)
+        if done:
+            return value
+        outcomes = execute_queries(**value)
+
+
+async def _dashboard_index_async(request, *args, **kwargs):
+    "Like _dashboard_index(), but executes the queries concurrently"
+    steps = _dashboard_index_steps(request, *args, **kwargs)
+    outcomes = None
+    while True:
+        done, value = await sync_to_async(_advance_steps)(steps, outcomes)
+        if done:
+            return value
+        outcomes = await execute_queries_async(**value)
+
+
+def _advance_steps(steps, outcomes):
+    # Returns (True, response) once the generator is done, as StopIteration
+    # cannot be raised through sync_to_async()
+    try:
+        return False, steps.send(outcomes)
+    except StopIteration as stop:
+        return True, stop.value
+
+
+def _dashboard_index_steps(
     request,
     sql_queries,
     unverified_sql_queries=None,
@@ -139,56 +252,17 @@ def _dashboard_index(
     template="django_sql_dashboard/dashboard.html",
     extra_context=None,
     json_mode=False,
+    timeouts_ms=None,
+    first_index=0,
+    deferred_results_url=None,
 ):
+    """
+    Generator that yields the keyword arguments for execute_queries(), is sent
+    the outcomes and then returns the response
+    """
     query_results = []
     alias = getattr(settings, "DASHBOARD_DB_ALIAS", "dashboard")
     row_limit = getattr(settings, "DASHBOARD_ROW_LIMIT", None) or 100
-    connection = connections[alias]
-    reserved_words = postgresql_reserved_words(connection)
-    with connection.cursor() as tables_cursor:
-        tables_cursor.execute(
-            """
-            with visible_tables as (
-              select table_name
-                from information_schema.tables
-                where table_schema = 'public'
-                order by table_name
-            ),
-            reserved_keywords as (
-              select word
-                from pg_get_keywords()
-                where catcode = 'R'
-            )
-            select
-              information_schema.columns.table_name,
-              array_to_json(array_agg(cast(column_name as text) order by ordinal_position)) as columns
-            from
-              information_schema.columns
-            join
-              visible_tables on
-              information_schema.columns.table_name = visible_tables.table_name
-            where
-              information_schema.columns.table_schema = 'public'
-            group by
-              information_schema.columns.table_name
-            order by
-              information_schema.columns.table_name
-        """
-        )
-        fetched = tables_cursor.fetchall()
-        available_tables = [
-            {
-                "name": row[0],
-                "columns": ", ".join(row[1]),
-                "sql_columns": ", ".join(
-                    [
-                        '"{}"'.format(column) if column in reserved_words else column
-                        for column in row[1]
-                    ]
-                ),
-            }
-            for row in fetched
-        ]
 
     parameters = []
     sql_query_parameter_errors = []
@@ -212,9 +286,18 @@ def _dashboard_index(
         if parameter != "sql"
     }
     extra_qs = "&{}".format(urlencode(parameter_values)) if parameter_values else ""
-    results_index = -1
+    results_index = first_index - 1
     if sql_queries:
-        for sql, parameter_error in zip(sql_queries, sql_query_parameter_errors):
+        # Maps position in query_results to the SQL that needs executing
+        pending = {}
+        # Maps position in query_results to the page of results to show
+        pages = {}
+        pending_timeouts_ms = []
+        for sql, parameter_error, timeout_ms in zip(
+            sql_queries,
+            sql_query_parameter_errors,
+            timeouts_ms or [None] * len(sql_queries),
+        ):
             results_index += 1
             sql = sql.strip().rstrip(";")
             base_error_result = {
@@ -244,59 +327,143 @@ def _dashboard_index(
                     dict(base_error_result, error="';' not allowed in SQL queries")
                 )
                 continue
-            with connection.cursor() as cursor:
-                duration_ms = None
+            if deferred_results_url:
+                query_results.append(
+                    dict(
+                        base_error_result,
+                        results_url=deferred_results_url(results_index),
+                        templates=["django_sql_dashboard/widgets/_deferred.html"],
+                    )
+                )
+                continue
+            page_token = request.GET.get("_page_{}".format(results_index))
+            if page_token:
                 try:
-                    cursor.execute("BEGIN;")
-                    start = time.perf_counter()
-                    # Running a SELECT prevents future SET TRANSACTION READ WRITE:
-                    cursor.execute("SELECT 1;")
-                    cursor.fetchall()
-                    cursor.execute(sql, parameter_values)
-                    try:
-                        rows = list(cursor.fetchmany(row_limit + 1))
-                    except ProgrammingError as e:
-                        rows = [{"statusmessage": str(cursor.statusmessage)}]
-                    duration_ms = (time.perf_counter() - start) * 1000.0
-                except Exception as e:
-                    query_results.append(dict(base_error_result, error=str(e)))
-                else:
-                    templates = ["django_sql_dashboard/widgets/default.html"]
-                    columns = [c.name for c in cursor.description]
-                    template_name = ("-".join(sorted(columns))) + ".html"
-                    if len(template_name) < 255:
-                        templates.insert(
-                            0,
-                            "django_sql_dashboard/widgets/" + template_name,
-                        )
-                    display_rows = displayable_rows(rows[:row_limit])
-                    column_details = [
-                        {
-                            "name": column,
-                            "is_unambiguous": columns.count(column) == 1,
-                            "sort_sql": apply_sort(sql, column),
-                            "sort_desc_sql": apply_sort(sql, column, True),
-                        }
-                        for column in columns
-                    ]
+                    pages[len(query_results)] = unsign_next_page(sql, page_token)
+                except signing.BadSignature:
                     query_results.append(
-                        {
-                            "index": str(results_index),
-                            "sql": sql,
-                            "textarea_rows": len(sql.split("\n")),
-                            "rows": [dict(zip(columns, row)) for row in display_rows],
-                            "row_lists": display_rows,
-                            "description": cursor.description,
-                            "columns": columns,
-                            "column_details": column_details,
-                            "truncated": len(rows) == row_limit + 1,
-                            "extra_qs": extra_qs,
-                            "duration_ms": duration_ms,
-                            "templates": templates,
-                        }
+                        dict(base_error_result, error="Invalid page token")
                     )
-                finally:
-                    cursor.execute("ROLLBACK;")
+                    continue
+            pending[len(query_results)] = sql
+            pending_timeouts_ms.append(timeout_ms or default_timeout_ms())
+            # Placeholder, replaced once the query has been executed
+            query_results.append(base_error_result)
+        # Later pages fetch just the rows they need from the original query
+        sqls_to_execute = []
+        execute_parameter_values = dict(parameter_values)
+        for position, sql in pending.items():
+            if position in pages:
+                sql, key_parameter_values = paginate_sql(
+                    sql,
+                    pages[position],
+                    row_limit + 1,
+                    "_page_key_{}".format(position),
+                )
+                execute_parameter_values.update(key_parameter_values)
+            sqls_to_execute.append(sql)
+        outcomes = yield {
+            "alias": alias,
+            "sqls": sqls_to_execute,
+            "parameter_values": execute_parameter_values,
+            "row_limit": row_limit,
+            "cache_ttl": dashboard.cache_ttl if dashboard else None,
+            "refresh_cache": bool(
+                request.GET.get("_refresh")
+                and request.user.has_perm("django_sql_dashboard.execute_sql")
+            ),
+            "timeout_ms": pending_timeouts_ms,
+            "running_queries": (
+                RunningQueries(
+                    request.user.pk, request.COOKIES.get(CANCEL_TOKEN_COOKIE)
+                )
+                if request.user.is_authenticated
+                else None
+            ),
+        }
+        # Pages of results are shown on the dashboard itself, even when they
+        # were loaded by a deferred placeholder
+        base_url = (
+            dashboard.get_absolute_url()
+            if dashboard
+            else reverse("django_sql_dashboard-index")
+        )
+
+        def page_url(index, token=None):
+            query_dict = request.GET.copy()
+            query_dict.pop("_page_{}".format(index), None)
+            if token:
+                query_dict["_page_{}".format(index)] = token
+            query_string = query_dict.urlencode()
+            return base_url + ("?" + query_string if query_string else "")
+
+        # Larger results are sent as JSON and rendered by the browser
+        client_render_rows = getattr(settings, "DASHBOARD_CLIENT_RENDER_ROWS", None)
+        for (position, sql), outcome in zip(pending.items(), outcomes):
+            base_error_result = query_results[position]
+            if isinstance(outcome, Exception):
+                query_results[position] = dict(base_error_result, error=str(outcome))
+                continue
+            description = outcome["description"]
+            templates = ["django_sql_dashboard/widgets/default.html"]
+            columns = [c.name for c in description]
+            template_name = ("-".join(sorted(columns))) + ".html"
+            if len(template_name) < 255:
+                templates.insert(
+                    0,
+                    "django_sql_dashboard/widgets/" + template_name,
+                )
+            display_rows = displayable_rows(
+                outcome["rows"], columns, [c.type_code for c in description]
+            )
+            # Links to pages need the SQL in the query string, not the POST body
+            next_page_url = None
+            if outcome["truncated"] and not too_long_so_use_post:
+                page = next_page(
+                    sql,
+                    pages.get(position),
+                    columns,
+                    [c.type_code for c in description],
+                    outcome["rows"],
+                )
+                next_page_url = page_url(
+                    base_error_result["index"], sign_next_page(sql, page)
+                )
+            column_details = [
+                {
+                    "name": column,
+                    "is_unambiguous": columns.count(column) == 1,
+                    "sort_sql": apply_sort(sql, column),
+                    "sort_desc_sql": apply_sort(sql, column, True),
+                }
+                for column in columns
+            ]
+            # result.rows is only built if a template uses it
+            query_results[position] = QueryResult(
+                {
+                    "index": base_error_result["index"],
+                    "sql": sql,
+                    "textarea_rows": len(sql.split("\n")),
+                    "row_lists": display_rows,
+                    "description": description,
+                    "columns": columns,
+                    "column_details": column_details,
+                    "truncated": outcome["truncated"],
+                    "row_offset": pages[position]["offset"] if position in pages else 0,
+                    "next_page_url": next_page_url,
+                    "first_page_url": (
+                        page_url(base_error_result["index"])
+                        if position in pages
+                        else None
+                    ),
+                    "render_in_browser": client_render_rows is not None
+                    and len(display_rows) > client_render_rows,
+                    "extra_qs": extra_qs,
+                    "duration_ms": outcome["duration_ms"],
+                    "computed_at": outcome.get("computed_at"),
+                    "templates": templates,
+                }
+            )
     # Page title, composed of truncated SQL queries
     html_title = "SQL Dashboard"
     if sql_queries:
@@ -339,12 +506,7 @@ def _dashboard_index(
                     {"sql": r["sql"], "rows": r["rows"]} for r in query_results
                 ],
             },
-            json_dumps_params={
-                "indent": 2,
-                "default": lambda o: o.isoformat()
-                if hasattr(o, "isoformat")
-                else str(o),
-            },
+            json_dumps_params={"indent": 2, "default": json_default},
         )
 
     context = {
@@ -352,7 +514,9 @@ def _dashboard_index(
         "html_title": html_title,
         "query_results": query_results,
         "unverified_sql_queries": unverified_sql_queries,
-        "available_tables": available_tables,
+        # Saved dashboards do not display the list of tables. The index page
+        # loads it on demand, revalidating with the ETag of the list
+        "tables_url": None if dashboard else reverse("django_sql_dashboard-tables"),
         "description": description,
         "dashboard": dashboard,
         "saved_dashboard": bool(dashboard),
@@ -361,7 +525,14 @@ def _dashboard_index(
         "user_can_execute_sql": user_can_execute_sql,
         "user_can_export_data": getattr(settings, "DASHBOARD_ENABLE_FULL_EXPORT", None)
         and user_can_execute_sql,
+        "export_formats": [
+            (format, EXPORT_FORMATS[format][0]) for format in available_export_formats()
+        ],
         "parameter_values": parameter_values.items(),
+        "results_computed_at": min(
+            (r["computed_at"] for r in query_results if r.get("computed_at")),
+            default=None,
+        ),
         "too_long_so_use_post": too_long_so_use_post,
         "saved_dashboards": saved_dashboards,
     }
@@ -380,6 +551,624 @@ def _dashboard_index(
     return response
 
 
+class QueryTimeout(Exception):
+    "A query was cancelled because it ran for longer than statement_timeout"
+
+    def __init__(self, duration_ms, timeout_ms=None):
+        self.duration_ms = duration_ms
+        self.timeout_ms = timeout_ms
+        super().__init__(duration_ms, timeout_ms)
+
+    def __str__(self):
+        message = "Query timed out after {:,.0f}ms".format(self.duration_ms)
+        if self.timeout_ms:
+            message += " - the time limit for this query is {:,}ms".format(
+                self.timeout_ms
+            )
+        return message
+
+
+def is_statement_timeout(e):
+    # psycopg2 raises QueryCanceled (SQLSTATE 57014) for any cancelled query
+    return getattr(
+        e.__cause__, "pgcode", None
+    ) == "57014" and "statement timeout" in str(e)
+
+
+def is_sql_error(e):
+    # SQLSTATE class 42 covers syntax errors and references to unknown names,
+    # and 0A000 statements such as a data-modifying WITH that are not allowed
+    # in a subquery
+    pgcode = getattr(e.__cause__, "pgcode", None) or ""
+    return pgcode.startswith("42") or pgcode == "0A000"
+
+
+def default_timeout_ms():
+    return getattr(settings, "DASHBOARD_DEFAULT_TIMEOUT_MS", None) or None
+
+
+# Running queries are forgotten after this long, in case a process died before
+# it could remove them
+RUNNING_QUERIES_TIMEOUT = 60 * 60
+
+# Set by the page's JavaScript when a form is submitted, to identify the queries
+# that the page's Cancel button should cancel
+CANCEL_TOKEN_COOKIE = "dashboard_cancel_token"
+
+# Most queries that can be recorded as running for one user at the same time
+MAX_RUNNING_QUERIES = 100
+
+
+class RunningQueries:
+    """
+    Records the queries a user is running in the cache, so they can be
+    cancelled from another request - for example from a second browser tab.
+
+    Each query is stored under its own key, in one of a fixed number of slots
+    for the user that is claimed using cache.add(), so processes recording
+    queries at the same time cannot overwrite each other's entries.
+
+    page_token identifies the page that started the queries, so that its
+    Cancel button leaves queries started by other pages alone.
+    """
+
+    def __init__(self, user_id, page_token=None):
+        self.key_prefix = "django_sql_dashboard:running:{}:".format(user_id)
+        self.page_token = page_token
+
+    def slot_keys(self):
+        return [self.key_prefix + str(slot) for slot in range(MAX_RUNNING_QUERIES)]
+
+    def all(self):
+        running = cache.get_many(self.slot_keys())
+        return {query["id"]: query for query in running.values()}
+
+    def add(self, alias, pid, started, sql):
+        "Returns an id for the query, or None if every slot is in use"
+        token = uuid.uuid4().hex
+        for slot, key in enumerate(self.slot_keys()):
+            query_id = "{}-{}".format(slot, token)
+            query = {
+                "id": query_id,
+                "alias": alias,
+                "pid": pid,
+                "started": started,
+                "sql": sql,
+                "page_token": self.page_token,
+            }
+            if cache.add(key, query, RUNNING_QUERIES_TIMEOUT):
+                return query_id
+        return None
+
+    def remove(self, query_id):
+        if query_id is None:
+            return
+        key = self.key_prefix + query_id.split("-", 1)[0]
+        query = cache.get(key)
+        if query is not None and query["id"] == query_id:
+            cache.delete(key)
+
+    def cancel(self, query_id=None, page_token=None):
+        """
+        Cancels all of the user's running queries, or just one of them, or
+        just the ones started by one page
+        """
+        cancelled = 0
+        for running_id, query in self.all().items():
+            if query_id and running_id != query_id:
+                continue
+            if page_token is not None and query.get("page_token") != page_token:
+                continue
+            with connections[query["alias"]].cursor() as cursor:
+                # Checking the transaction start time ensures the backend is
+                # still running this query, and not one started since
+                cursor.execute(
+                    "select pg_cancel_backend(pid) from pg_stat_activity "
+                    "where pid = %s and xact_start = %s",
+                    [query["pid"], query["started"]],
+                )
+                row = cursor.fetchone()
+            if row and row[0]:
+                cancelled += 1
+        return cancelled
+
+    @contextmanager
+    def track(self, connection, pid, started, sql):
+        query_id = self.add(connection.alias, pid, started, sql)
+        try:
+            yield
+        finally:
+            self.remove(query_id)
+
+
+class RolledBackTransactions:
+    """
+    Executes each query in its own transaction that is always rolled back.
+
+    The statements that start a transaction are sent in a single round trip,
+    and the ROLLBACK of each transaction is sent along with the statements that
+    start the next one - or by close() - so running N queries takes 2N + 1
+    round trips rather than 4N.
+
+    If running_queries is provided, each query is recorded there along with
+    the PID of the backend running it while it executes, so it can be
+    cancelled.
+    """
+
+    def __init__(self, connection, running_queries=None):
+        self.connection = connection
+        self.running_queries = running_queries
+        self.in_transaction = False
+
+    def execute(
+        self, sql, parameter_values, row_limit, timeout_ms=None, limit_in_sql=None
+    ):
+        if limit_in_sql is None:
+            limit_in_sql = getattr(settings, "DASHBOARD_LIMIT_IN_SQL", True)
+        with self.connection.cursor() as cursor:
+            prelude = ["BEGIN;"]
+            params = []
+            if self.in_transaction:
+                prelude.insert(0, "ROLLBACK;")
+            if timeout_ms:
+                prelude.append("SET LOCAL statement_timeout = %s;")
+                params.append(int(timeout_ms))
+            # Running a SELECT prevents future SET TRANSACTION READ WRITE:
+            prelude.append("SELECT pg_backend_pid(), now();")
+            cursor.execute(" ".join(prelude), params)
+            self.in_transaction = True
+            pid, started = cursor.fetchone()
+            start = time.perf_counter()
+            # The SQL is sent on its own so error positions match what was typed,
+            # wrapped in a LIMIT so PostgreSQL can plan for the rows we need
+            try:
+                with self.track(pid, started, sql):
+                    cursor.execute(
+                        limit_sql(sql, row_limit + 1) if limit_in_sql else sql,
+                        parameter_values,
+                    )
+            except OperationalError as e:
+                if is_statement_timeout(e):
+                    raise QueryTimeout(
+                        (time.perf_counter() - start) * 1000.0, timeout_ms
+                    ) from e
+                raise
+            except (ProgrammingError, NotSupportedError) as e:
+                # Not every statement can be used as a subquery, so run those
+                # as written - which also reports errors against the typed SQL
+                if not (limit_in_sql and is_sql_error(e)):
+                    raise
+                return self.execute(
+                    sql, parameter_values, row_limit, timeout_ms, limit_in_sql=False
+                )
+            try:
+                rows = list(cursor.fetchmany(row_limit + 1))
+            except ProgrammingError as e:
+                rows = [{"statusmessage": str(cursor.statusmessage)}]
+            duration_ms = (time.perf_counter() - start) * 1000.0
+            return {
+                "rows": rows[:row_limit],
+                "description": cursor.description,
+                "truncated": len(rows) == row_limit + 1,
+                "duration_ms": duration_ms,
+            }
+
+    def track(self, pid, started, sql):
+        if self.running_queries is None:
+            return nullcontext()
+        return self.running_queries.track(self.connection, pid, started, sql)
+
+    def close(self):
+        if self.in_transaction:
+            with self.connection.cursor() as cursor:
+                cursor.execute("ROLLBACK;")
+            self.in_transaction = False
+
+
+# Longest a process waits for another process to finish running the same query
+IN_FLIGHT_LOCK_TIMEOUT = 60
+
+# Waiting processes only notice the lock has gone when they next poll, so the
+# result is kept for longer than the lock
+SHARED_RESULT_TIMEOUT = 2 * IN_FLIGHT_LOCK_TIMEOUT
+
+in_flight_queries = SingleFlight()
+
+
+def _execute_sql_across_processes(cache_key, execute):
+    token = uuid.uuid4().hex
+    lock_key = cache_key + ":in-flight"
+    if cache.add(lock_key, token, IN_FLIGHT_LOCK_TIMEOUT):
+        try:
+            outcome = execute()
+            cache.set(cache_key + ":shared:" + token, outcome, SHARED_RESULT_TIMEOUT)
+            return outcome
+        finally:
+            cache.delete(lock_key)
+    # Another process is running this query - wait for it to share its result,
+    # which is still available after it has released the lock
+    leader_token = None
+    deadline = time.monotonic() + IN_FLIGHT_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        current_token = cache.get(lock_key)
+        leader_token = current_token or leader_token
+        if leader_token is not None:
+            outcome = cache.get(cache_key + ":shared:" + leader_token)
+            if outcome is not None:
+                return outcome
+        if current_token is None:
+            # The leader failed, or finished before we saw its token
+            break
+        time.sleep(0.05)
+    return execute()
+
+
+def execute_sql_coalesced(
+    transactions, sql, parameter_values, row_limit, timeout_ms=None
+):
+    """
+    Like RolledBackTransactions.execute(), but identical queries that are
+    already running in this process - or in any process if
+    DASHBOARD_COALESCE_ACROSS_PROCESSES is set - wait for and share the result
+    of that execution instead.
+    """
+    cache_key = result_cache_key(
+        transactions.connection.alias, sql, parameter_values, row_limit
+    )
+
+    def execute():
+        return transactions.execute(sql, parameter_values, row_limit, timeout_ms)
+
+    if getattr(settings, "DASHBOARD_COALESCE_ACROSS_PROCESSES", None):
+        outcome = in_flight_queries.do(
+            cache_key, lambda: _execute_sql_across_processes(cache_key, execute)
+        )
+    else:
+        outcome = in_flight_queries.do(cache_key, execute)
+    # Callers may modify the outcome, so each one gets their own copy
+    return dict(outcome)
+
+
+class WorkerConnections:
+    """
+    Gives each worker thread of an executor its own connection, which is
+    reused for every query that thread runs. close() closes all of them, and
+    must be called once the executor has shut down.
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.lock = threading.Lock()
+        self.connections = []
+
+    def get(self):
+        # Django keeps a separate connection object for each thread
+        connection = connections[self.alias]
+        with self.lock:
+            if not any(c is connection for c in self.connections):
+                # Allows close() to be called from another thread
+                connection.inc_thread_sharing()
+                self.connections.append(connection)
+        return connection
+
+    def close(self):
+        with self.lock:
+            for connection in self.connections:
+                connection.close()
+                connection.dec_thread_sharing()
+            self.connections = []
+
+
+def _execute_sql_in_thread(
+    worker_connections,
+    sql,
+    parameter_values,
+    row_limit,
+    timeout_ms=None,
+    running_queries=None,
+):
+    with closing(
+        RolledBackTransactions(worker_connections.get(), running_queries)
+    ) as transactions:
+        return execute_sql_coalesced(
+            transactions, sql, parameter_values, row_limit, timeout_ms
+        )
+
+
+def _execute_uncached_queries(
+    alias, sqls, parameter_values, row_limit, timeouts_ms, running_queries=None
+):
+    outcomes = []
+    max_workers = min(
+        getattr(settings, "DASHBOARD_PARALLEL_QUERIES", None) or 1, len(sqls)
+    )
+    if max_workers > 1:
+        worker_connections = WorkerConnections(alias)
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [
+                    executor.submit(
+                        _execute_sql_in_thread,
+                        worker_connections,
+                        sql,
+                        parameter_values,
+                        row_limit,
+                        timeout_ms,
+                        running_queries,
+                    )
+                    for sql, timeout_ms in zip(sqls, timeouts_ms)
+                ]
+        finally:
+            worker_connections.close()
+        for future in futures:
+            outcomes.append(future.exception() or future.result())
+        return outcomes
+    with closing(
+        RolledBackTransactions(connections[alias], running_queries)
+    ) as transactions:
+        for sql, timeout_ms in zip(sqls, timeouts_ms):
+            try:
+                outcomes.append(
+                    execute_sql_coalesced(
+                        transactions, sql, parameter_values, row_limit, timeout_ms
+                    )
+                )
+            except Exception as e:
+                outcomes.append(e)
+    return outcomes
+
+
+def result_cache_key(alias, sql, parameter_values, row_limit):
+    key = json.dumps([alias, sql, sorted(parameter_values.items()), row_limit])
+    return "django_sql_dashboard:results:" + hashlib.sha256(key.encode()).hexdigest()
+
+
+# Maximum time a background refresh of a stale cached result can take before
+# another one is allowed to start
+REFRESH_LOCK_TIMEOUT = 300
+
+
+def refresh_cached_result(
+    alias, sql, parameter_values, row_limit, cache_key, timeout, timeout_ms=None
+):
+    """
+    Re-run a query in a background thread and replace its cached result.
+
+    A lock in the cache ensures only one refresh runs at a time for each cached
+    result, across all processes. Returns the thread, or None if a refresh is
+    already in progress.
+    """
+    lock_key = cache_key + ":refresh"
+    if not cache.add(lock_key, True, REFRESH_LOCK_TIMEOUT):
+        return None
+
+    def refresh():
+        worker_connections = WorkerConnections(alias)
+        try:
+            outcome = _execute_sql_in_thread(
+                worker_connections, sql, parameter_values, row_limit, timeout_ms
+            )
+        except Exception:
+            # Keep serving the stale result until the next attempt
+            pass
+        else:
+            outcome["computed_at"] = timezone.now()
+            cache.set(cache_key, outcome, timeout)
+        finally:
+            worker_connections.close()
+            cache.delete(lock_key)
+
+    thread = threading.Thread(target=refresh, daemon=True)
+    thread.start()
+    return thread
+
+
+def execute_queries(
+    alias,
+    sqls,
+    parameter_values,
+    row_limit,
+    cache_ttl=None,
+    refresh_cache=False,
+    timeout_ms=None,
+    running_queries=None,
+):
+    """
+    Returns an outcome dictionary or an exception for each SQL query, in the
+    same order as the queries.
+
+    If cache_ttl is set successful outcomes are cached for that many seconds,
+    and their "computed_at" key records when the query was executed. With the
+    DASHBOARD_CACHE_STALE_TTL setting, expired results continue to be returned
+    for that many extra seconds while they are refreshed in the background.
+
+    timeout_ms can be a single statement timeout for every query, or a list
+    with a timeout for each query. Queries are recorded in running_queries,
+    if provided, while they execute.
+    """
+    timeouts_ms, outcomes, cache_keys = _cached_outcomes(
+        alias, sqls, parameter_values, row_limit, cache_ttl, refresh_cache, timeout_ms
+    )
+    uncached = [i for i, outcome in enumerate(outcomes) if outcome is None]
+    executed = _execute_uncached_queries(
+        alias,
+        [sqls[i] for i in uncached],
+        parameter_values,
+        row_limit,
+        [timeouts_ms[i] for i in uncached],
+        running_queries,
+    )
+    _store_outcomes(outcomes, uncached, executed, cache_keys, cache_ttl)
+    return outcomes
+
+
+async def execute_queries_async(
+    alias,
+    sqls,
+    parameter_values,
+    row_limit,
+    cache_ttl=None,
+    refresh_cache=False,
+    timeout_ms=None,
+    running_queries=None,
+):
+    """
+    Like execute_queries(), but runs the queries concurrently on a pool of
+    worker threads, each of which reuses one connection for its queries.
+    """
+    timeouts_ms, outcomes, cache_keys = await sync_to_async(
+        _cached_outcomes, thread_sensitive=False
+    )(alias, sqls, parameter_values, row_limit, cache_ttl, refresh_cache, timeout_ms)
+    uncached = [i for i, outcome in enumerate(outcomes) if outcome is None]
+    executed = []
+    if uncached:
+        max_workers = min(
+            getattr(settings, "DASHBOARD_PARALLEL_QUERIES", None) or len(uncached),
+            len(uncached),
+        )
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        worker_connections = WorkerConnections(alias)
+        loop = asyncio.get_running_loop()
+
+        def shutdown():
+            executor.shutdown()
+            worker_connections.close()
+
+        try:
+            executed = await asyncio.gather(
+                *[
+                    loop.run_in_executor(
+                        executor,
+                        _execute_sql_in_thread,
+                        worker_connections,
+                        sqls[i],
+                        parameter_values,
+                        row_limit,
+                        timeouts_ms[i],
+                        running_queries,
+                    )
+                    for i in uncached
+                ],
+                return_exceptions=True,
+            )
+        finally:
+            await sync_to_async(shutdown, thread_sensitive=False)()
+    await sync_to_async(_store_outcomes, thread_sensitive=False)(
+        outcomes, uncached, executed, cache_keys, cache_ttl
+    )
+    return outcomes
+
+
+def _cached_outcomes(
+    alias, sqls, parameter_values, row_limit, cache_ttl, refresh_cache, timeout_ms
+):
+    """
+    Returns (timeouts_ms, outcomes, cache_keys) - outcomes has the cached
+    outcome for each query, or None if it needs to be executed
+    """
+    if not isinstance(timeout_ms, (list, tuple)):
+        timeout_ms = [timeout_ms] * len(sqls)
+    outcomes = [None] * len(sqls)
+    cache_keys = []
+    stale_ttl = getattr(settings, "DASHBOARD_CACHE_STALE_TTL", None) or 0
+    if cache_ttl:
+        cache_keys = [
+            result_cache_key(alias, sql, parameter_values, row_limit) for sql in sqls
+        ]
+        if not refresh_cache:
+            cached = cache.get_many(cache_keys)
+            outcomes = [cached.get(key) for key in cache_keys]
+            expired_before = timezone.now() - timedelta(seconds=cache_ttl)
+            for sql, key, outcome, query_timeout_ms in zip(
+                sqls, cache_keys, outcomes, timeout_ms
+            ):
+                if outcome and stale_ttl and outcome["computed_at"] < expired_before:
+                    refresh_cached_result(
+                        alias,
+                        sql,
+                        parameter_values,
+                        row_limit,
+                        key,
+                        cache_ttl + stale_ttl,
+                        query_timeout_ms,
+                    )
+    return timeout_ms, outcomes, cache_keys
+
+
+def _store_outcomes(outcomes, uncached, executed, cache_keys, cache_ttl):
+    "Fills in the outcomes of executed queries, caching them if cache_ttl is set"
+    stale_ttl = getattr(settings, "DASHBOARD_CACHE_STALE_TTL", None) or 0
+    to_cache = {}
+    for i, outcome in zip(uncached, executed):
+        if cache_ttl and not isinstance(outcome, Exception):
+            outcome["computed_at"] = timezone.now()
+            to_cache[cache_keys[i]] = outcome
+        outcomes[i] = outcome
+    if to_cache:
+        cache.set_many(to_cache, cache_ttl + stale_ttl)
+
+
+@login_required
+def dashboard_running_queries(request):
+    """
+    Lists the queries the current user is running as JSON, or on POST cancels
+    them - all of them, just the one identified by the "id" field, or just
+    those started by the page identified by the "page" field
+    """
+    running_queries = RunningQueries(request.user.pk)
+    if request.method == "POST":
+        data = {
+            "cancelled": running_queries.cancel(
+                request.POST.get("id"), request.POST.get("page")
+            )
+        }
+    else:
+        data = {
+            "queries": [
+                {"id": query_id, "sql": query["sql"], "started": query["started"]}
+                for query_id, query in running_queries.all().items()
+            ]
+        }
+    response = JsonResponse(data)
+    response["cache-control"] = "private"
+    return response
+
+
+@login_required
+def dashboard_tables_json(request):
+    """
+    The tables and columns available to query, as JSON. Each table includes
+    signed links to count its rows and to select all of its columns.
+    """
+    if not request.user.has_perm("django_sql_dashboard.execute_sql"):
+        return HttpResponseForbidden("You do not have permission to execute SQL")
+    alias = getattr(settings, "DASHBOARD_DB_ALIAS", "dashboard")
+    connection = connections[alias]
+    index_url = reverse("django_sql_dashboard-index")
+    tables = []
+    for table in available_tables(connection):
+        sqls = [
+            "select count(*) from {}".format(table["name"]),
+            "select {} from {}".format(table["sql_columns"], table["name"]),
+        ]
+        query_string = urlencode({"sql": [sign_sql(sql) for sql in sqls]}, doseq=True)
+        tables.append(
+            {
+                "name": table["name"],
+                "columns": table["columns"],
+                "url": "{}?{}".format(index_url, query_string),
+            }
+        )
+    response = JsonResponse({"tables": tables})
+    # The ETag covers the list itself, so it changes with anything that
+    # affects it - including permissions the schema fingerprint ignores
+    etag = '"{}"'.format(hashlib.sha256(response.content).hexdigest())
+    response = get_conditional_response(request, etag=etag) or response
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
 def dashboard_json(request, slug):
     disable_json = getattr(settings, "DASHBOARD_DISABLE_JSON", None)
     if disable_json:
@@ -387,9 +1176,15 @@ def dashboard_json(request, slug):
     return dashboard(request, slug, json_mode=True)
 
 
-def dashboard(request, slug, json_mode=False):
-    dashboard = get_object_or_404(Dashboard, slug=slug)
-    # Can current user see it, based on view_policy?
+async def dashboard_json_async(request, slug):
+    disable_json = getattr(settings, "DASHBOARD_DISABLE_JSON", None)
+    if disable_json:
+        return HttpResponseForbidden("JSON export is disabled")
+    return await dashboard_async(request, slug, json_mode=True)
+
+
+def view_policy_denied(request, dashboard):
+    "Returns a 403 response if the user cannot see the dashboard, else None"
     view_policy = dashboard.view_policy
     owner = dashboard.owned_by
     denied = HttpResponseForbidden("You cannot access this dashboard")
@@ -416,24 +1211,366 @@ def dashboard(request, slug, json_mode=False):
             request.user != owner and not request.user.is_superuser
         ):
             return denied
+    return None
+
+
+def dashboard(request, slug, json_mode=False):
+    denied, dashboard_kwargs = _saved_dashboard(request, slug, json_mode)
+    if denied:
+        return denied
+    return _dashboard_index(request, **dashboard_kwargs)
+
+
+async def dashboard_async(request, slug, json_mode=False):
+    "Async version of dashboard(), which executes the queries concurrently"
+    denied, dashboard_kwargs = await sync_to_async(_saved_dashboard)(
+        request, slug, json_mode
+    )
+    if denied:
+        return denied
+    return await _dashboard_index_async(request, **dashboard_kwargs)
+
+
+def _saved_dashboard(request, slug, json_mode):
+    """
+    Returns (denied, kwargs) - a 403 response if the user cannot see the
+    dashboard, otherwise the keyword arguments for _dashboard_index()
+    """
+    dashboard = get_object_or_404(Dashboard, slug=slug)
+    # Can current user see it, based on view_policy?
+    denied = view_policy_denied(request, dashboard)
+    if denied:
+        return denied, None
+    queries = list(dashboard.queries.all())
+    deferred_results_url = None
+    if getattr(settings, "DASHBOARD_DEFER_QUERIES", None) and not json_mode:
+        # Render the page straight away, then load each query's results
+        querystring = request.GET.urlencode()
+
+        def deferred_results_url(index):
+            url = reverse(
+                "django_sql_dashboard-dashboard_query", args=[dashboard.slug, index]
+            )
+            return url + "?" + querystring if querystring else url
+
+    return None, {
+        "sql_queries": [query.sql for query in queries],
+        "timeouts_ms": [query.timeout_ms or dashboard.timeout_ms for query in queries],
+        "title": dashboard.title,
+        "description": dashboard.description,
+        "dashboard": dashboard,
+        "template": "django_sql_dashboard/saved_dashboard.html",
+        "json_mode": json_mode,
+        "deferred_results_url": deferred_results_url,
+    }
+
+
+def dashboard_query(request, slug, index):
+    "Renders the results of one query from a saved dashboard as an HTML fragment"
+    dashboard = get_object_or_404(Dashboard, slug=slug)
+    denied = view_policy_denied(request, dashboard)
+    if denied:
+        return denied
+    queries = list(dashboard.queries.all())
+    if index >= len(queries):
+        raise Http404("Query not found")
+    query = queries[index]
     return _dashboard_index(
         request,
-        sql_queries=[query.sql for query in dashboard.queries.all()],
+        sql_queries=[query.sql],
+        timeouts_ms=[query.timeout_ms or dashboard.timeout_ms],
         title=dashboard.title,
         description=dashboard.description,
         dashboard=dashboard,
-        template="django_sql_dashboard/saved_dashboard.html",
-        json_mode=json_mode,
+        template="django_sql_dashboard/_query_results.html",
+        first_index=index,
+    )
+
+
+def dashboard_query_json(request, slug, index):
+    """
+    Streams the full results of one query in a saved dashboard as compact JSON,
+    optionally a page at a time using ?_size= and the returned ?_next= token
+    """
+    disable_json = getattr(settings, "DASHBOARD_DISABLE_JSON", None)
+    if disable_json:
+        return HttpResponseForbidden("JSON export is disabled")
+    dashboard = get_object_or_404(Dashboard, slug=slug)
+    denied = view_policy_denied(request, dashboard)
+    if denied:
+        return denied
+    queries = list(dashboard.queries.all())
+    if index >= len(queries):
+        raise Http404("Query not found")
+    sql = queries[index].sql.strip().rstrip(";")
+    timeout_ms = (
+        queries[index].timeout_ms or dashboard.timeout_ms or default_timeout_ms()
+    )
+
+    def error(message):
+        response = JsonResponse({"error": message}, status=400)
+        response["cache-control"] = "private"
+        return response
+
+    try:
+        parameters = extract_named_parameters(sql)
+    except ValueError as e:
+        return error(str(e))
+    if ";" in sql:
+        return error("';' not allowed in SQL queries")
+    parameter_values = {
+        parameter: request.GET.get(parameter, "")
+        for parameter in parameters
+        if parameter != "sql"
+    }
+    offset = 0
+    page_size = None
+    if request.GET.get("_size"):
+        try:
+            page_size = int(request.GET["_size"])
+        except ValueError:
+            page_size = 0
+        if page_size < 1:
+            return error("_size must be a positive integer")
+        if request.GET.get("_next"):
+            try:
+                offset = unsign_page_token(request.GET["_next"])
+            except signing.BadSignature:
+                return error("Invalid _next token")
+        # Fetch one extra row to find out if there is another page
+        sql = "select * from (\n{}\n) as results offset {} limit {}".format(
+            sql, offset, page_size + 1
+        )
+    alias = getattr(settings, "DASHBOARD_DB_ALIAS", "dashboard")
+    batches = fetch_batches(
+        alias,
+        sql,
+        parameter_values,
+        timeout_ms=timeout_ms,
+        running_queries=(
+            RunningQueries(request.user.pk) if request.user.is_authenticated else None
+        ),
+    )
+    # Run the query before the response starts so errors get a 400 status
+    start = time.perf_counter()
+    try:
+        first_batch = next(batches)
+    except DatabaseError as e:
+        if is_statement_timeout(e):
+            duration_ms = (time.perf_counter() - start) * 1000.0
+            return error(str(QueryTimeout(duration_ms, timeout_ms)))
+        return error(str(e))
+    response = StreamingHttpResponse(
+        stream_query_json(
+            request,
+            dashboard,
+            queries[index].sql,
+            first_batch,
+            batches,
+            offset,
+            page_size,
+        ),
+        content_type="application/json",
     )
+    if request.user.is_authenticated:
+        response["cache-control"] = "private"
+    return response
+
+
+def stream_query_json(request, dashboard, sql, first_batch, batches, offset, page_size):
+    "Generator that writes a query's rows into a JSON document as they arrive"
+
+    def dumps(value):
+        return json.dumps(value, default=json_default, separators=(",", ":"))
+
+    chunk_size = export_chunk_size()
+    columns = None
+    num_rows = 0
+    has_next = False
+    parts = []
+    size = 0
+    with closing(batches):
+        for description, records in itertools.chain([first_batch], batches):
+            if columns is None:
+                columns = [c.name for c in description]
+                parts.append(
+                    '{{"title":{},"sql":{},"columns":{},"rows":['.format(
+                        dumps(dashboard.title), dumps(sql), dumps(columns)
+                    )
+                )
+            for record in records:
+                if page_size is not None and num_rows == page_size:
+                    has_next = True
+                    break
+                row = dumps(
+                    {
+                        column: finite_or_none(value)
+                        for column, value in zip(columns, record)
+                    }
+                )
+                parts.append(row if num_rows == 0 else "," + row)
+                size += len(row) + 1
+                num_rows += 1
+            if has_next:
+                break
+            if size >= chunk_size:
+                yield "".join(parts)
+                parts = []
+                size = 0
+    next_token = next_url = None
+    if has_next:
+        next_token = sign_page_token(offset + num_rows)
+        querydict = request.GET.copy()
+        querydict["_next"] = next_token
+        next_url = request.build_absolute_uri(
+            request.path + "?" + querydict.urlencode()
+        )
+    parts.append(
+        '],"next":{},"next_url":{}}}'.format(dumps(next_token), dumps(next_url))
+    )
+    yield "".join(parts)
 
 
 non_alpha_re = re.compile(r"[^a-zA-Z0-9]")
 
 
+def export_chunk_size():
+    # Exports are sent to the client in chunks of at least this many bytes
+    return getattr(settings, "DASHBOARD_EXPORT_CHUNK_SIZE", None) or 64 * 1024
+
+
+def export_fetch_size():
+    # Number of rows fetched from the server-side cursor at a time
+    return getattr(settings, "DASHBOARD_EXPORT_FETCH_SIZE", None) or 2000
+
+
+class _ChunkedQueueWriter:
+    "File-like object that passes data from copy_expert() to a queue in chunks"
+
+    def __init__(self, chunks, cancelled, chunk_size):
+        self.chunks = chunks
+        self.cancelled = cancelled
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.size = 0
+
+    def write(self, data):
+        if self.cancelled.is_set():
+            raise IOError("Export was cancelled")
+        self.buffer.append(data)
+        self.size += len(data)
+        if self.size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.chunks.put(b"".join(self.buffer))
+            self.buffer = []
+            self.size = 0
+
+
+def stream_copy_export(
+    alias, sql, parameter_values, format, timeout_ms=None, running_queries=None
+):
+    """
+    Generator that streams the results of a query as CSV or TSV, using
+    COPY ... TO STDOUT so that PostgreSQL does the formatting. Like
+    fetch_batches(), the COPY runs in a read-only transaction that is always
+    rolled back.
+    """
+    options = "FORMAT csv, HEADER"
+    if format == "tsv":
+        options += ", DELIMITER E'\\t'"
+    # Bounded, so a slow client slows down the COPY rather than using memory
+    chunks = queue.Queue(maxsize=16)
+    cancelled = threading.Event()
+    chunk_size = export_chunk_size()
+    raw_connections = []
+
+    def copy():
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                raw_connections.append(connection.connection)
+                try:
+                    prelude = ["BEGIN;", "SET TRANSACTION READ ONLY;"]
+                    params = []
+                    if timeout_ms:
+                        prelude.append("SET LOCAL statement_timeout = %s;")
+                        params.append(int(timeout_ms))
+                    prelude.append("SELECT pg_backend_pid(), now();")
+                    cursor.execute(" ".join(prelude), params)
+                    pid, started = cursor.fetchone()
+                    # New lines stop a trailing -- comment hiding the parenthesis
+                    copy_sql = "COPY (\n{}\n) TO STDOUT WITH ({})".format(
+                        cursor.mogrify(sql, parameter_values).decode("utf-8"),
+                        options,
+                    )
+                    writer = _ChunkedQueueWriter(chunks, cancelled, chunk_size)
+                    with (
+                        running_queries.track(connection, pid, started, sql)
+                        if running_queries
+                        else nullcontext()
+                    ), connection.wrap_database_errors:
+                        cursor.copy_expert(copy_sql, writer)
+                    writer.flush()
+                finally:
+                    cursor.execute("ROLLBACK;")
+            chunks.put(None)
+        except Exception as e:
+            chunks.put(e)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=copy, daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        if thread.is_alive():
+            # The client went away before the export finished
+            cancelled.set()
+            for raw_connection in raw_connections:
+                raw_connection.cancel()
+            while thread.is_alive():
+                try:
+                    chunks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+
+# Maps export format to (label, content type)
+EXPORT_FORMATS = {
+    "csv": ("CSV", "text/csv"),
+    "tsv": ("TSV", "text/tab-separated-values"),
+    "ndjson": ("NDJSON", "application/x-ndjson"),
+    "arrow": ("Arrow", "application/vnd.apache.arrow.stream"),
+    "parquet": ("Parquet", "application/vnd.apache.parquet"),
+}
+
+# These formats need the optional pyarrow dependency
+ARROW_EXPORT_FORMATS = ("arrow", "parquet")
+
+
+def available_export_formats():
+    return [
+        format
+        for format in EXPORT_FORMATS
+        if pyarrow is not None or format not in ARROW_EXPORT_FORMATS
+    ]
+
+
 def export_sql_results(request):
     export_key = [k for k in request.POST.keys() if k.startswith("export_")][0]
     _, format, sql_index = export_key.split("_")
-    assert format in ("csv", "tsv")
+    if format not in available_export_formats():
+        return HttpResponseBadRequest("Unsupported export format")
     sqls = request.POST.getlist("sql")
     sql = sqls[int(sql_index)]
     parameter_values = {
@@ -446,11 +1583,80 @@ def export_sql_results(request):
     filename = non_alpha_re.sub("-", sql.lower()[:30]) + sql_hash
 
     filename_plus_ext = filename + "." + format
+    running_queries = RunningQueries(request.user.pk)
+
+    if format == "ndjson":
+        content = stream_ndjson_export(alias, sql, parameter_values, running_queries)
+    elif format in ARROW_EXPORT_FORMATS:
+        content = stream_arrow_export(
+            alias, sql, parameter_values, format, running_queries
+        )
+    elif getattr(settings, "DASHBOARD_EXPORT_USE_COPY", None):
+        content = stream_copy_export(
+            alias, sql, parameter_values, format, running_queries=running_queries
+        )
+    else:
+        content = stream_csv_export(
+            alias, sql, parameter_values, format, running_queries
+        )
+    response = StreamingHttpResponse(content, content_type=EXPORT_FORMATS[format][1])
+    response["Content-Disposition"] = 'attachment; filename="' + filename_plus_ext + '"'
+    return response
+
 
+def fetch_batches(
+    alias,
+    sql,
+    parameter_values,
+    batch_size=None,
+    timeout_ms=None,
+    running_queries=None,
+):
+    """
+    Generator that executes SQL using a server-side cursor, in a transaction
+    that is always rolled back, and yields a (description, rows) pair for each
+    batch of rows - ending with an empty batch
+    """
+    batch_size = int(batch_size or export_fetch_size())
     connection = connections[alias]
-    connection.cursor()  # To initialize connection
-    cursor = connection.create_cursor(name="c" + filename.replace("-", "_"))
+    with connection.cursor() as cursor:
+        try:
+            # Running a SELECT prevents future SET TRANSACTION READ WRITE:
+            if timeout_ms:
+                cursor.execute(
+                    "BEGIN; SET LOCAL statement_timeout = %s; "
+                    "SELECT pg_backend_pid(), now();",
+                    [int(timeout_ms)],
+                )
+            else:
+                cursor.execute("BEGIN; SELECT pg_backend_pid(), now();")
+            pid, started = cursor.fetchone()
+            with (
+                running_queries.track(connection, pid, started, sql)
+                if running_queries
+                else nullcontext()
+            ):
+                # A cursor that is not WITH HOLD streams rows as they are
+                # fetched, rather than materializing the full result when it
+                # is declared
+                cursor.execute(
+                    "DECLARE dashboard_rows NO SCROLL CURSOR FOR " + sql,
+                    parameter_values,
+                )
+                while True:
+                    cursor.execute(
+                        "FETCH FORWARD {} FROM dashboard_rows".format(batch_size)
+                    )
+                    records = cursor.fetchall()
+                    yield cursor.description, records
+                    if not records:
+                        break
+        finally:
+            cursor.execute("ROLLBACK;")
+
 
+def stream_csv_export(alias, sql, parameter_values, format, running_queries=None):
+    "Generator that streams the results of a query as CSV or TSV"
     csvfile = StringIO()
     csvwriter = csv.writer(
         csvfile,
@@ -467,30 +1673,103 @@ def export_sql_results(request):
         csvfile.truncate()
         return data
 
-    def rows():
-        try:
-            cursor.execute(sql, parameter_values)
-            done_header = False
-            while True:
-                records = cursor.fetchmany(size=2000)
-                if not done_header:
-                    csvwriter.writerow([r.name for r in cursor.description])
-                    yield read_and_flush()
-                    done_header = True
-                if not records:
-                    break
-                for record in records:
-                    csvwriter.writerow(record)
-                    yield read_and_flush()
-        finally:
-            cursor.close()
+    chunk_size = export_chunk_size()
+    done_header = False
+    with closing(
+        fetch_batches(alias, sql, parameter_values, running_queries=running_queries)
+    ) as batches:
+        for description, records in batches:
+            if not done_header:
+                csvwriter.writerow([r.name for r in description])
+                done_header = True
+            csvwriter.writerows(records)
+            # Yield in large chunks rather than once per row
+            if csvfile.tell() >= chunk_size:
+                yield read_and_flush()
+    remaining = read_and_flush()
+    if remaining:
+        yield remaining
 
-    response = StreamingHttpResponse(
-        rows(),
-        content_type={
-            "csv": "text/csv",
-            "tsv": "text/tab-separated-values",
-        }[format],
-    )
-    response["Content-Disposition"] = 'attachment; filename="' + filename_plus_ext + '"'
-    return response
+
+def stream_ndjson_export(alias, sql, parameter_values, running_queries=None):
+    "Generator that streams the results of a query as newline-delimited JSON"
+    chunk_size = export_chunk_size()
+    lines = []
+    size = 0
+    with closing(
+        fetch_batches(alias, sql, parameter_values, running_queries=running_queries)
+    ) as batches:
+        for description, records in batches:
+            columns = [c.name for c in description]
+            for record in records:
+                line = json.dumps(
+                    {
+                        column: finite_or_none(value)
+                        for column, value in zip(columns, record)
+                    },
+                    default=json_default,
+                )
+                lines.append(line + "\n")
+                size += len(line) + 1
+            if size >= chunk_size:
+                yield "".join(lines)
+                lines = []
+                size = 0
+    if lines:
+        yield "".join(lines)
+
+
+class _DrainableSink:
+    "Write-only file-like object for pyarrow writers that can be emptied"
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_arrow_export(alias, sql, parameter_values, format, running_queries=None):
+    """
+    Generator that streams the results of a query as an Arrow IPC stream or as
+    Parquet, converting one batch of rows at a time
+    """
+    sink = _DrainableSink()
+    writer = None
+    converters = None
+    with closing(
+        fetch_batches(alias, sql, parameter_values, running_queries=running_queries)
+    ) as batches:
+        for description, records in batches:
+            if writer is None:
+                schema, converters = arrow_schema(description)
+                if format == "parquet":
+                    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+                else:
+                    writer = pyarrow.ipc.new_stream(sink, schema)
+            if records:
+                writer.write_batch(arrow_record_batch(schema, converters, records))
+            data = sink.drain()
+            if data:
+                yield data
+    writer.close()
+    yield sink.drain()
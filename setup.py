@@ -35,10 +35,13 @@ setup(
             "templates/django_sql_dashboard/widgets/*.html",
             "migrations/*.py",
             "templatetags/*.py",
+            "management/*.py",
+            "management/commands/*.py",
         ]
     },
     install_requires=["Django>=3.0", "markdown", "bleach"],
     extras_require={
+        "arrow": ["pyarrow"],
         "test": [
             "black>=22.3.0",
             "psycopg2",
@@ -49,6 +52,7 @@ setup(
             "testing.postgresql",
             "beautifulsoup4",
             "html5lib",
+            "pyarrow",
         ],
     },
     tests_require=["django-sql-dashboard[test]"],
@@ -0,0 +1,10 @@
+from django.contrib import admin
+from django.urls import include, path
+
+import django_sql_dashboard
+
+
+urlpatterns = [
+    path("dashboard/", include(django_sql_dashboard.async_urls)),
+    path("admin/", admin.site.urls),
+]
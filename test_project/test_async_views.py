@@ -0,0 +1,117 @@
+import time
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import Permission
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient
+
+from django_sql_dashboard.utils import sign_sql
+
+pytestmark = pytest.mark.urls("config.async_urls")
+
+
+def _get(client, *args, **kwargs):
+    return async_to_sync(client.get)(*args, **kwargs)
+
+
+@pytest.fixture
+def async_admin_client(admin_user):
+    client = AsyncClient()
+    client.force_login(admin_user)
+    return client
+
+
+def test_async_dashboard_index_runs_queries_concurrently(
+    async_admin_client, dashboard_db, settings
+):
+    settings.DASHBOARD_DEFAULT_TIMEOUT_MS = 5000
+    sqls = [
+        "select pg_sleep(0.3), pg_backend_pid() as pid, {} as n".format(n)
+        for n in range(3)
+    ]
+    sqls.insert(1, "select * from not_a_table")
+    start = time.perf_counter()
+    response = _get(
+        async_admin_client,
+        "/dashboard/",
+        {"sql": [sign_sql(sql) for sql in sqls]},
+    )
+    assert time.perf_counter() - start < 0.8
+    assert response.status_code == 200
+    results = response.context["query_results"]
+    assert [r["sql"] for r in results] == sqls
+    assert [r["rows"][0]["n"] if r["rows"] else None for r in results] == [
+        0,
+        None,
+        1,
+        2,
+    ]
+    assert "does not exist" in results[1]["error"]
+    assert len({r["rows"][0]["pid"] for r in results if r["rows"]}) == 3
+
+
+def test_async_dashboard_index_permissions(dashboard_db, django_user_model):
+    client = AsyncClient()
+    response = _get(client, "/dashboard/")
+    assert response.status_code == 302
+    assert response.url.startswith("/admin/login/")
+    user = django_user_model.objects.create(username="regular")
+    client.force_login(user)
+    assert _get(client, "/dashboard/").status_code == 403
+    user.user_permissions.add(Permission.objects.get(codename="execute_sql"))
+    assert _get(client, "/dashboard/").status_code == 200
+
+
+def test_async_dashboard_index_post(async_admin_client, dashboard_db):
+    response = async_to_sync(async_admin_client.post)(
+        "/dashboard/", {"sql": "select 1 + 1"}
+    )
+    assert response.status_code == 302
+    assert response.url.startswith("/dashboard/?sql=")
+
+
+def test_async_saved_dashboard(saved_dashboard):
+    async_client = AsyncClient()
+    response = _get(async_client, "/dashboard/test/")
+    assert response.status_code == 200
+    assert b"44" in response.content
+    assert b"77" in response.content
+    assert _get(async_client, "/dashboard/test.json").json() == {
+        "title": "Test dashboard",
+        "queries": [
+            {"sql": "select 11 + 33", "rows": [{"?column?": 44}]},
+            {"sql": "select 22 + 55", "rows": [{"?column?": 77}]},
+        ],
+    }
+    saved_dashboard.view_policy = "loggedin"
+    saved_dashboard.save()
+    assert _get(async_client, "/dashboard/test/").status_code == 403
+    assert _get(async_client, "/dashboard/test.json").status_code == 403
+
+
+def test_async_dashboard_reuses_worker_connections(
+    async_admin_client, dashboard_db, settings
+):
+    settings.DASHBOARD_PARALLEL_QUERIES = 2
+    sqls = ["select {} as n, pg_sleep(0.01)".format(n) for n in range(6)]
+    created = []
+
+    def on_connection_created(sender, connection, **kwargs):
+        if connection.alias == "dashboard":
+            created.append(connection)
+
+    connection_created.connect(on_connection_created)
+    try:
+        response = _get(
+            async_admin_client,
+            "/dashboard/",
+            {"sql": [sign_sql(sql) for sql in sqls]},
+        )
+    finally:
+        connection_created.disconnect(on_connection_created)
+    results = response.context["query_results"]
+    assert [r["rows"][0]["n"] for r in results] == list(range(6))
+    # One connection per worker thread, all closed once the queries are done
+    assert len(created) == 2
+    assert all(connection.connection is None for connection in created)
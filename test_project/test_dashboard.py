@@ -1,11 +1,32 @@
+import threading
+import time
 import urllib.parse
+from datetime import timedelta
+from unittest import mock
 
 import pytest
 from bs4 import BeautifulSoup
 from django.core import signing
+from django.core.cache import cache
 from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
-from django_sql_dashboard.utils import SQL_SALT, is_valid_base64_json, sign_sql
+from django_sql_dashboard.utils import (
+    SQL_SALT,
+    apply_sort,
+    available_tables,
+    is_valid_base64_json,
+    limit_sql,
+    sign_sql,
+)
+from django_sql_dashboard.views import (
+    RunningQueries,
+    _execute_sql_across_processes,
+    execute_queries,
+    result_cache_key,
+)
 
 
 def test_dashboard_submit_sql(admin_client, dashboard_db):
@@ -210,31 +231,37 @@ def test_saved_dashboard_errors_sql_not_in_textarea(admin_client, saved_dashboar
 def test_dashboard_show_available_tables(admin_client):
     response = admin_client.get("/dashboard/")
     soup = BeautifulSoup(response.content, "html5lib")
-    lis = soup.find("ul").findAll("li")
+    tables_url = soup.select("div.available-tables")[0]["data-tables-url"]
+    assert tables_url == "/dashboard/-/tables.json"
+    response = admin_client.get(tables_url)
+    assert response.status_code == 200
     details = [
         {
-            "table": li.find("a").text,
-            "columns": li.find("p").text,
-            "href": li.find("a")["href"],
+            "table": table["name"],
+            "columns": table["columns"],
+            "href": table["url"],
         }
-        for li in lis
-        if li.find("a").text.startswith("django_sql_dashboard")
-        or li.find("a").text == "switches"
+        for table in response.json()["tables"]
+        if table["name"].startswith("django_sql_dashboard")
+        or table["name"] == "switches"
     ]
     # Decode the href in each one into a SQL query
     for detail in details:
-        href = detail.pop("href")
-        detail["href_sql"] = urllib.parse.parse_qs(href)["sql"][0].rsplit(":", 1)[0]
+        href = urllib.parse.urlparse(detail.pop("href"))
+        assert href.path == "/dashboard/"
+        detail["href_sql"] = urllib.parse.parse_qs(href.query)["sql"][1].rsplit(":", 1)[
+            0
+        ]
     assert details == [
         {
             "table": "django_sql_dashboard_dashboard",
-            "columns": "id, slug, title, description, created_at, edit_group_id, edit_policy, owned_by_id, view_group_id, view_policy",
-            "href_sql": "select id, slug, title, description, created_at, edit_group_id, edit_policy, owned_by_id, view_group_id, view_policy from django_sql_dashboard_dashboard",
+            "columns": "id, slug, title, description, created_at, edit_group_id, edit_policy, owned_by_id, view_group_id, view_policy, cache_ttl, timeout_ms",
+            "href_sql": "select id, slug, title, description, created_at, edit_group_id, edit_policy, owned_by_id, view_group_id, view_policy, cache_ttl, timeout_ms from django_sql_dashboard_dashboard",
         },
         {
             "table": "django_sql_dashboard_dashboardquery",
-            "columns": "id, sql, dashboard_id, _order",
-            "href_sql": "select id, sql, dashboard_id, _order from django_sql_dashboard_dashboardquery",
+            "columns": "id, sql, dashboard_id, _order, timeout_ms",
+            "href_sql": "select id, sql, dashboard_id, _order, timeout_ms from django_sql_dashboard_dashboardquery",
         },
         {
             "table": "switches",
@@ -242,3 +269,759 @@ def test_dashboard_show_available_tables(admin_client):
             "href_sql": 'select id, name, "on" from switches',
         },
     ]
+
+
+def _ran_schema_query(captured):
+    return any("information_schema.columns" in q["sql"] for q in captured)
+
+
+def test_dashboard_index_does_not_list_tables(admin_client, dashboard_db):
+    cache.clear()
+    with CaptureQueriesContext(connections["dashboard"]) as captured:
+        response = admin_client.get("/dashboard/")
+    assert response.status_code == 200
+    assert not _ran_schema_query(captured)
+    assert not any("pg_class" in q["sql"] for q in captured)
+    assert b"django_sql_dashboard_dashboardquery" not in response.content
+
+
+def test_available_tables_json_caching_headers(admin_client, dashboard_db):
+    response = admin_client.get("/dashboard/-/tables.json")
+    assert response.status_code == 200
+    assert response["cache-control"] == "private, no-cache"
+    etag = response["etag"]
+    not_modified = admin_client.get("/dashboard/-/tables.json", HTTP_IF_NONE_MATCH=etag)
+    assert not_modified.status_code == 304
+    assert not_modified["etag"] == etag
+    assert not_modified.content == b""
+
+
+def test_available_tables_json_changes_with_schema(admin_client, settings):
+    # Use the default connection, so the new table is visible in this transaction
+    settings.DASHBOARD_DB_ALIAS = "default"
+    before_etag = admin_client.get("/dashboard/-/tables.json")["etag"]
+    with connections["default"].cursor() as cursor:
+        cursor.execute("create table new_table (id integer)")
+    response = admin_client.get(
+        "/dashboard/-/tables.json", HTTP_IF_NONE_MATCH=before_etag
+    )
+    assert response.status_code == 200
+    assert response["etag"] != before_etag
+    assert "new_table" in [table["name"] for table in response.json()["tables"]]
+
+
+def test_available_tables_json_etag_covers_the_list(admin_client, dashboard_db):
+    # Permission changes alter the list without changing the schema fingerprint
+    table = {"name": "t", "columns": "id, secret", "sql_columns": "id, secret"}
+    with mock.patch(
+        "django_sql_dashboard.views.available_tables", return_value=[table]
+    ):
+        before = admin_client.get("/dashboard/-/tables.json")
+    table = dict(table, columns="id", sql_columns="id")
+    with mock.patch(
+        "django_sql_dashboard.views.available_tables", return_value=[table]
+    ):
+        after = admin_client.get(
+            "/dashboard/-/tables.json", HTTP_IF_NONE_MATCH=before["etag"]
+        )
+    assert after.status_code == 200
+    assert after["etag"] != before["etag"]
+    assert after.json()["tables"][0]["columns"] == "id"
+
+
+def test_available_tables_json_requires_permission(client, django_user_model):
+    response = client.get("/dashboard/-/tables.json")
+    assert response.status_code == 302
+    django_user_model.objects.create_user(username="noperm", password="password")
+    client.login(username="noperm", password="password")
+    response = client.get("/dashboard/-/tables.json")
+    assert response.status_code == 403
+
+
+def test_available_tables_are_cached(admin_client, dashboard_db):
+    cache.clear()
+    with CaptureQueriesContext(connections["dashboard"]) as first:
+        admin_client.get("/dashboard/-/tables.json")
+    with CaptureQueriesContext(connections["dashboard"]) as second:
+        admin_client.get("/dashboard/-/tables.json")
+    assert _ran_schema_query(first)
+    assert not _ran_schema_query(second)
+
+
+def test_available_tables_cache_disabled(admin_client, dashboard_db, settings):
+    settings.DASHBOARD_SCHEMA_CACHE_TTL = 0
+    cache.clear()
+    admin_client.get("/dashboard/-/tables.json")
+    with CaptureQueriesContext(connections["dashboard"]) as captured:
+        admin_client.get("/dashboard/-/tables.json")
+    assert _ran_schema_query(captured)
+
+
+def test_available_tables_cache_invalidated_by_schema_change(db):
+    cache.clear()
+    connection = connections["default"]
+    before = [table["name"] for table in available_tables(connection)]
+    assert "new_table" not in before
+    with connection.cursor() as cursor:
+        cursor.execute("create table new_table (id integer)")
+    after = [table["name"] for table in available_tables(connection)]
+    assert "new_table" in after
+
+
+@pytest.mark.parametrize(
+    "alter_sql,expected_columns",
+    (
+        ("alter table new_table drop column name", "id"),
+        ("alter table new_table rename column name to title", "id, title"),
+    ),
+)
+def test_available_tables_cache_invalidated_by_column_change(
+    db, alter_sql, expected_columns
+):
+    cache.clear()
+    connection = connections["default"]
+    with connection.cursor() as cursor:
+        cursor.execute("create table new_table (id integer, name text)")
+    before = {table["name"]: table for table in available_tables(connection)}
+    assert before["new_table"]["columns"] == "id, name"
+    with connection.cursor() as cursor:
+        cursor.execute(alter_sql)
+    after = {table["name"]: table for table in available_tables(connection)}
+    assert after["new_table"]["columns"] == expected_columns
+
+
+@pytest.mark.parametrize("path", ("/dashboard/test/", "/dashboard/test.json"))
+def test_saved_dashboard_skips_available_tables(admin_client, saved_dashboard, path):
+    cache.clear()
+    with CaptureQueriesContext(connections["dashboard"]) as captured:
+        response = admin_client.get(path)
+    assert response.status_code == 200
+    assert not _ran_schema_query(captured)
+    assert not any("pg_class" in q["sql"] for q in captured)
+
+
+def test_parallel_queries(admin_client, saved_dashboard, settings):
+    settings.DASHBOARD_PARALLEL_QUERIES = 4
+    saved_dashboard.queries.all().delete()
+    sqls = [
+        "select pg_sleep(0.05), pg_backend_pid() as pid, 1 as n",
+        "select * from not_a_table",
+        "select pg_sleep(0.05), pg_backend_pid() as pid, 2 as n",
+        "select pg_sleep(0.05), pg_backend_pid() as pid, 3 as n",
+    ]
+    for sql in sqls:
+        saved_dashboard.queries.create(sql=sql)
+    data = admin_client.get("/dashboard/test.json").json()
+    assert [query["sql"] for query in data["queries"]] == sqls
+    rows = [query["rows"] for query in data["queries"]]
+    assert [r[0]["n"] if r else None for r in rows] == [1, None, 2, 3]
+    # Each query ran on its own connection
+    assert len({r[0]["pid"] for r in rows if r}) == 3
+    # And the errors are reported against the correct query
+    response = admin_client.get("/dashboard/test/")
+    soup = BeautifulSoup(response.content, "html5lib")
+    assert "does not exist" in soup.select(".query-error .error-message")[0].text
+    assert [div.get("id") for div in soup.select(".query-results")] == [
+        "query-results-0",
+        None,
+        "query-results-2",
+        "query-results-3",
+    ]
+
+
+def test_parallel_queries_reuse_worker_connections(
+    admin_client, saved_dashboard, settings
+):
+    cache.clear()
+    settings.DASHBOARD_PARALLEL_QUERIES = 2
+    saved_dashboard.queries.all().delete()
+    for n in range(6):
+        saved_dashboard.queries.create(sql="select {} as n, pg_sleep(0.01)".format(n))
+    created = []
+
+    def on_connection_created(sender, connection, **kwargs):
+        if connection.alias == "dashboard":
+            created.append(connection)
+
+    connection_created.connect(on_connection_created)
+    try:
+        data = admin_client.get("/dashboard/test.json").json()
+    finally:
+        connection_created.disconnect(on_connection_created)
+    assert [query["rows"][0]["n"] for query in data["queries"]] == list(range(6))
+    # One connection per worker thread, all closed once the queries are done
+    assert len(created) == 2
+    assert all(connection.connection is None for connection in created)
+
+
+@pytest.mark.parametrize("timeout_ms", (None, 1000))
+def test_round_trips_per_dashboard(client, saved_dashboard, timeout_ms):
+    cache.clear()
+    saved_dashboard.queries.create(sql="select * from not_a_table")
+    saved_dashboard.queries.create(sql="create table not_allowed (id integer)")
+    saved_dashboard.queries.create(sql="select 5 + 5")
+    round_trips = []
+
+    def count_round_trips(execute, sql, params, many, context):
+        round_trips.append(sql)
+        return execute(sql, params, many, context)
+
+    with connections["dashboard"].execute_wrapper(count_round_trips):
+        outcomes = execute_queries(
+            "dashboard",
+            [query.sql for query in saved_dashboard.queries.all()],
+            {},
+            100,
+            timeout_ms=timeout_ms,
+        )
+    # One round trip to start each transaction, one for each query and a
+    # final ROLLBACK - plus two more for each of the failing queries, which
+    # are run again without a LIMIT in case that caused the error
+    assert len(round_trips) == 2 * 5 + 1 + 2 * 2
+    assert round_trips[-1] == "ROLLBACK;"
+    assert [
+        o["rows"][0][0] if isinstance(o, dict) else type(o).__name__ for o in outcomes
+    ] == [44, 77, "ProgrammingError", "InternalError", 10]
+    assert "read-only transaction" in str(outcomes[3])
+    if timeout_ms:
+        assert "SET LOCAL statement_timeout" in round_trips[0]
+    with connections["dashboard"].cursor() as cursor:
+        cursor.execute("select count(*) from pg_class where relname = 'not_allowed'")
+        assert cursor.fetchone()[0] == 0
+
+
+def test_query_timeouts(client, saved_dashboard, settings):
+    # The dashboard_db fixture sets statement_timeout=100 for the connection
+    saved_dashboard.queries.all().delete()
+    saved_dashboard.queries.create(sql="select pg_sleep(0.2), 1 as n", timeout_ms=400)
+    saved_dashboard.queries.create(sql="select pg_sleep(0.2), 2 as n", timeout_ms=50)
+    saved_dashboard.queries.create(sql="select pg_sleep(0.2), 3 as n")
+    saved_dashboard.queries.create(sql="select 4 as n")
+    response = client.get("/dashboard/test/")
+    soup = BeautifulSoup(response.content, "html5lib")
+    errors = [p.text for p in soup.select(".query-error .error-message")]
+    assert len(errors) == 2
+    assert errors[0].startswith("Query timed out after ")
+    assert errors[0].endswith(" - the time limit for this query is 50ms")
+    # Falls back to the connection's statement_timeout
+    assert errors[1].startswith("Query timed out after ")
+    assert "time limit" not in errors[1]
+    assert [div.get("id") for div in soup.select(".query-results")] == [
+        "query-results-0",
+        None,
+        None,
+        "query-results-3",
+    ]
+    # Dashboard timeout and then DASHBOARD_DEFAULT_TIMEOUT_MS apply to queries
+    # without their own timeout
+    saved_dashboard.timeout_ms = 400
+    saved_dashboard.save()
+    data = client.get("/dashboard/test.json").json()
+    assert [len(query["rows"]) for query in data["queries"]] == [1, 0, 1, 1]
+    saved_dashboard.timeout_ms = None
+    saved_dashboard.save()
+    settings.DASHBOARD_DEFAULT_TIMEOUT_MS = 400
+    data = client.get("/dashboard/test.json").json()
+    assert [len(query["rows"]) for query in data["queries"]] == [1, 0, 1, 1]
+    # Also applies to the streaming JSON for a single query
+    response = client.get("/dashboard/test/1.json")
+    assert response.status_code == 400
+    assert response.json()["error"].endswith("the time limit for this query is 50ms")
+    assert client.get("/dashboard/test/2.json").status_code == 200
+
+
+def _wait_for_running_queries(running_queries, count):
+    deadline = time.monotonic() + 5
+    while len(running_queries.all()) != count:
+        assert time.monotonic() < deadline, "Timed out waiting for queries"
+        time.sleep(0.01)
+
+
+def test_cancel_running_queries(admin_client, admin_user, dashboard_db):
+    cache.clear()
+    running_queries = RunningQueries(admin_user.pk)
+    outcomes = []
+
+    def run():
+        try:
+            outcomes.extend(
+                execute_queries(
+                    "dashboard",
+                    ["select pg_sleep(10)"],
+                    {},
+                    100,
+                    timeout_ms=20000,
+                    running_queries=running_queries,
+                )
+            )
+        finally:
+            connections["dashboard"].close()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    _wait_for_running_queries(running_queries, 1)
+    listed = admin_client.get("/dashboard/-/running/").json()["queries"]
+    assert [query["sql"] for query in listed] == ["select pg_sleep(10)"]
+    # Only cancels queries that match the id, if one is provided
+    response = admin_client.post("/dashboard/-/running/", {"id": "nope"})
+    assert response.json() == {"cancelled": 0}
+    start = time.monotonic()
+    response = admin_client.post("/dashboard/-/running/")
+    assert response.json() == {"cancelled": 1}
+    thread.join()
+    assert time.monotonic() - start < 5
+    assert "canceling statement due to user request" in str(outcomes[0])
+    assert running_queries.all() == {}
+    assert admin_client.get("/dashboard/-/running/").json() == {"queries": []}
+
+
+def test_cancel_running_queries_for_page(admin_client, admin_user, dashboard_db):
+    cache.clear()
+    running_queries = RunningQueries(admin_user.pk, "page-a")
+    outcomes = []
+
+    def run():
+        try:
+            outcomes.extend(
+                execute_queries(
+                    "dashboard",
+                    ["select pg_sleep(10)"],
+                    {},
+                    100,
+                    timeout_ms=20000,
+                    running_queries=running_queries,
+                )
+            )
+        finally:
+            connections["dashboard"].close()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    _wait_for_running_queries(running_queries, 1)
+    # The Cancel button on another page leaves this query running
+    response = admin_client.post("/dashboard/-/running/", {"page": "page-b"})
+    assert response.json() == {"cancelled": 0}
+    response = admin_client.post("/dashboard/-/running/", {"page": "page-a"})
+    assert response.json() == {"cancelled": 1}
+    thread.join()
+    assert "canceling statement due to user request" in str(outcomes[0])
+
+
+@pytest.mark.parametrize("method", ("get", "post"))
+def test_dashboard_records_cancel_token(admin_client, dashboard_db, settings, method):
+    settings.DASHBOARD_ROW_LIMIT = 2
+    page_tokens = []
+    original_add = RunningQueries.add
+
+    def add(self, *args):
+        page_tokens.append(self.page_token)
+        return original_add(self, *args)
+
+    admin_client.cookies["dashboard_cancel_token"] = "abc"
+    sql = "select * from generate_series(1, 5)"
+    with mock.patch.object(RunningQueries, "add", add):
+        if method == "get":
+            response = admin_client.get("/dashboard/", {"sql": sign_sql(sql)})
+        else:
+            response = admin_client.post("/dashboard/", {"sql": sql}, follow=True)
+            assert "abc" not in response.redirect_chain[0][0]
+    assert page_tokens == ["abc"]
+    soup = BeautifulSoup(response.content, "html5lib")
+    assert "abc" not in soup.find("a", string="next page")["href"]
+
+
+def test_running_queries_each_have_their_own_key(admin_user):
+    cache.clear()
+    # Separate instances, as separate processes would have
+    query_ids = []
+
+    def add(n):
+        query_ids.append(
+            RunningQueries(admin_user.pk).add("dashboard", n, None, str(n))
+        )
+
+    threads = [threading.Thread(target=add, args=(n,)) for n in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    running_queries = RunningQueries(admin_user.pk)
+    assert sorted(query["pid"] for query in running_queries.all().values()) == list(
+        range(20)
+    )
+    for query_id in query_ids[:10]:
+        running_queries.remove(query_id)
+    assert sorted(running_queries.all()) == sorted(query_ids[10:])
+    # Removing a query that has already gone leaves the others alone
+    new_id = running_queries.add("dashboard", 99, None, "select 99")
+    running_queries.remove(query_ids[0])
+    assert new_id in running_queries.all()
+
+
+def test_running_queries_requires_login(client, dashboard_db):
+    response = client.get("/dashboard/-/running/")
+    assert response.status_code == 302
+    assert client.post("/dashboard/-/running/").status_code == 302
+
+
+def test_cancel_queries_form(client, admin_client, saved_dashboard):
+    assert b'class="cancel-queries"' in admin_client.get("/dashboard/").content
+    assert b'class="cancel-queries"' in admin_client.get("/dashboard/test/").content
+    assert b'class="cancel-queries"' not in client.get("/dashboard/test/").content
+
+
+def test_closed_export_removes_running_query(
+    admin_client, admin_user, dashboard_db, settings
+):
+    cache.clear()
+    settings.DASHBOARD_ENABLE_FULL_EXPORT = True
+    settings.DASHBOARD_EXPORT_CHUNK_SIZE = 10
+    response = admin_client.post(
+        "/dashboard/",
+        {"sql": "select * from generate_series(0, 10000)", "export_csv_0": "1"},
+    )
+    running_queries = RunningQueries(admin_user.pk)
+    assert next(iter(response.streaming_content)).startswith(b"generate_series")
+    assert len(running_queries.all()) == 1
+    response.close()
+    assert running_queries.all() == {}
+
+
+def test_deferred_queries(client, saved_dashboard, settings):
+    settings.DASHBOARD_DEFER_QUERIES = True
+    saved_dashboard.queries.create(sql="select %(name)s::text as greeting")
+    with CaptureQueriesContext(connections["dashboard"]) as captured:
+        response = client.get("/dashboard/test/?name=Cleo")
+    assert not captured.captured_queries
+    soup = BeautifulSoup(response.content, "html5lib")
+    assert [
+        (div["id"], div["data-results-url"]) for div in soup.select(".query-deferred")
+    ] == [
+        ("query-results-0", "/dashboard/test/0/?name=Cleo"),
+        ("query-results-1", "/dashboard/test/1/?name=Cleo"),
+        ("query-results-2", "/dashboard/test/2/?name=Cleo"),
+    ]
+    # Each placeholder loads its results from a separate request
+    response = client.get("/dashboard/test/1/")
+    soup = BeautifulSoup(response.content, "html5lib")
+    assert [div.get("id") for div in soup.select(".query-results")] == [
+        "query-results-1"
+    ]
+    assert soup.select("td")[0].text == "77"
+    assert b"<html" not in response.content
+    response = client.get("/dashboard/test/2/?name=Cleo")
+    assert BeautifulSoup(response.content, "html5lib").select("td")[0].text == "Cleo"
+    assert client.get("/dashboard/test/3/").status_code == 404
+    # JSON is not deferred
+    data = client.get("/dashboard/test.json").json()
+    assert data["queries"][0]["rows"] == [{"?column?": 44}]
+    saved_dashboard.view_policy = "loggedin"
+    saved_dashboard.save()
+    assert client.get("/dashboard/test/1/").status_code == 403
+
+
+def _ran_sql(captured, sql):
+    return any(q["sql"] in (sql, limit_sql(sql, 101)) for q in captured)
+
+
+def test_saved_dashboard_result_cache(client, admin_client, saved_dashboard):
+    cache.clear()
+    saved_dashboard.cache_ttl = 60
+    saved_dashboard.save()
+    with CaptureQueriesContext(connections["dashboard"]) as first:
+        response = client.get("/dashboard/test/")
+    assert _ran_sql(first, "select 11 + 33")
+    assert b"Cached results computed" in response.content
+    # Only users who can execute SQL see the refresh button
+    assert b"Refresh now" not in response.content
+    with CaptureQueriesContext(connections["dashboard"]) as second:
+        response = client.get("/dashboard/test/")
+        json_response = client.get("/dashboard/test.json")
+    assert not _ran_sql(second, "select 11 + 33")
+    assert b"44" in response.content
+    assert json_response.json()["queries"][0]["rows"] == [{"?column?": 44}]
+    # ?_refresh=1 is ignored for users without execute_sql
+    with CaptureQueriesContext(connections["dashboard"]) as third:
+        client.get("/dashboard/test/?_refresh=1")
+    assert not _ran_sql(third, "select 11 + 33")
+    response = admin_client.get("/dashboard/test/")
+    assert b"Refresh now" in response.content
+    with CaptureQueriesContext(connections["dashboard"]) as fourth:
+        admin_client.get("/dashboard/test/?_refresh=1")
+    assert _ran_sql(fourth, "select 11 + 33")
+
+
+def test_saved_dashboard_result_cache_keyed_by_parameters(client, saved_dashboard):
+    cache.clear()
+    saved_dashboard.cache_ttl = 60
+    saved_dashboard.save()
+    saved_dashboard.queries.create(sql="select %(name)s as name")
+    assert b"<td>one</td>" in client.get("/dashboard/test/?name=one").content
+    assert b"<td>two</td>" in client.get("/dashboard/test/?name=two").content
+
+
+def _rendered_widgets(response):
+    return [
+        t.name for t in response.templates if t.name.endswith("widgets/default.html")
+    ]
+
+
+@pytest.mark.parametrize("widget_cache_ttl", (None, 60))
+def test_widget_cache(
+    client, admin_client, saved_dashboard, settings, widget_cache_ttl
+):
+    settings.DASHBOARD_WIDGET_CACHE_TTL = widget_cache_ttl
+    cache.clear()
+    saved_dashboard.cache_ttl = 60
+    saved_dashboard.save()
+    first = client.get("/dashboard/test/")
+    assert len(_rendered_widgets(first)) == 2
+    second = client.get("/dashboard/test/")
+    assert second.content == first.content
+    if widget_cache_ttl:
+        assert _rendered_widgets(second) == []
+    else:
+        assert len(_rendered_widgets(second)) == 2
+    # Users who can execute SQL see different HTML, cached separately
+    response = admin_client.get("/dashboard/test/")
+    assert len(_rendered_widgets(response)) == 2
+    assert b"data-count-url" in response.content
+    # As do changed results
+    saved_dashboard.queries.create(sql="select 1 + 1")
+    response = client.get("/dashboard/test/")
+    assert len(_rendered_widgets(response)) == (1 if widget_cache_ttl else 3)
+
+
+def test_widget_cache_hit_when_query_runs_again(client, saved_dashboard, settings):
+    # The results are not cached, so each request runs the queries again - with
+    # a different duration_ms, and bytea values in new memoryview objects
+    settings.DASHBOARD_WIDGET_CACHE_TTL = 60
+    cache.clear()
+    saved_dashboard.queries.all().delete()
+    saved_dashboard.queries.create(sql="select '\\x0102'::bytea as b, 1 as n")
+    assert len(_rendered_widgets(client.get("/dashboard/test/"))) == 1
+    with CaptureQueriesContext(connections["dashboard"]) as captured:
+        response = client.get("/dashboard/test/")
+    assert _ran_sql(captured, "select '\\x0102'::bytea as b, 1 as n")
+    assert _rendered_widgets(response) == []
+
+
+def test_saved_dashboard_not_cached_by_default(client, saved_dashboard):
+    cache.clear()
+    client.get("/dashboard/test/")
+    with CaptureQueriesContext(connections["dashboard"]) as captured:
+        response = client.get("/dashboard/test/")
+    assert _ran_sql(captured, "select 11 + 33")
+    assert b"Cached results computed" not in response.content
+
+
+def test_saved_dashboard_stale_while_revalidate(client, saved_dashboard, settings):
+    cache.clear()
+    settings.DASHBOARD_CACHE_STALE_TTL = 600
+    saved_dashboard.cache_ttl = 60
+    saved_dashboard.save()
+    client.get("/dashboard/test/")
+    key = result_cache_key("dashboard", "select 11 + 33", {}, 100)
+    # Make the cached result stale, with a value we can recognize
+    stale = cache.get(key)
+    stale["computed_at"] = timezone.now() - timedelta(seconds=120)
+    stale["rows"] = [(-1,)]
+    cache.set(key, stale)
+    # Stale result should be served immediately
+    response = client.get("/dashboard/test.json")
+    assert response.json()["queries"][0]["rows"] == [{"?column?": -1}]
+    # While a single background refresh replaces it
+    for _ in range(50):
+        if cache.get(key)["rows"] != [(-1,)]:
+            break
+        time.sleep(0.1)
+    assert cache.get(key)["rows"] == [(44,)]
+    assert cache.get(key + ":refresh") is None
+    response = client.get("/dashboard/test.json")
+    assert response.json()["queries"][0]["rows"] == [{"?column?": 44}]
+
+
+def test_saved_dashboard_stale_refresh_is_deduplicated(
+    client, saved_dashboard, settings
+):
+    cache.clear()
+    settings.DASHBOARD_CACHE_STALE_TTL = 600
+    saved_dashboard.cache_ttl = 60
+    saved_dashboard.save()
+    client.get("/dashboard/test/")
+    key = result_cache_key("dashboard", "select 11 + 33", {}, 100)
+    stale = cache.get(key)
+    stale["computed_at"] = timezone.now() - timedelta(seconds=120)
+    cache.set(key, stale)
+    # Pretend another viewer has already started a refresh
+    cache.set(key + ":refresh", True)
+    with CaptureQueriesContext(connections["dashboard"]) as captured:
+        for _ in range(3):
+            client.get("/dashboard/test/")
+        time.sleep(0.2)
+    assert not _ran_sql(captured, "select 11 + 33")
+    assert cache.get(key)["computed_at"] == stale["computed_at"]
+
+
+def test_identical_in_flight_queries_are_coalesced(
+    admin_client, saved_dashboard, settings
+):
+    settings.DASHBOARD_PARALLEL_QUERIES = 4
+    saved_dashboard.queries.all().delete()
+    for _ in range(3):
+        saved_dashboard.queries.create(
+            sql="select pg_backend_pid() as pid, pg_sleep(0.05)"
+        )
+    saved_dashboard.queries.create(sql="select pg_backend_pid() as pid")
+    data = admin_client.get("/dashboard/test.json").json()
+    pids = [query["rows"][0]["pid"] for query in data["queries"]]
+    # The three identical queries shared a single execution
+    assert len(set(pids[:3])) == 1
+    assert pids[3] != pids[0]
+
+
+def test_queries_coalesced_across_processes(settings):
+    cache.clear()
+    key = result_cache_key("dashboard", "select 1", {}, 100)
+    executions = []
+    outcomes = []
+
+    def execute():
+        executions.append(1)
+        time.sleep(0.2)
+        return {"rows": [(1,)]}
+
+    def run():
+        # Calls the cross-process path directly, as each thread stands in for a
+        # separate process that SingleFlight cannot coordinate with
+        outcomes.append(_execute_sql_across_processes(key, execute))
+
+    threads = [threading.Thread(target=run) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(executions) == 1
+    assert outcomes == [{"rows": [(1,)]}] * 5
+    assert cache.get(key + ":in-flight") is None
+
+
+def _follow_pages(client, url):
+    # Returns the values in the first column of every page of results
+    values = []
+    while url:
+        # A page that links back to itself would otherwise loop forever
+        assert len(values) < 100, "Too many pages"
+        response = client.get(url)
+        assert response.status_code == 200
+        soup = BeautifulSoup(response.content, "html5lib")
+        assert not soup.select(".query-results p[style]")
+        values.extend(
+            [td.text for td in tr.findAll("td")][0]
+            for tr in soup.select(".query-results tbody tr")
+        )
+        next_link = soup.find("a", string="next page")
+        url = next_link["href"] if next_link else None
+    return values
+
+
+@pytest.mark.parametrize(
+    "sql,expected",
+    (
+        (
+            "select * from (values (3), (1), (4), (1), (5), (9), (2)) as t (n)",
+            ["3", "1", "4", "1", "5", "9", "2"],
+        ),
+        ("select * from generate_series(1, 5) -- hi", ["1", "2", "3", "4", "5"]),
+        (
+            apply_sort(
+                "select * from (values (1), (null), (2), (1), (1), (1), (null), (3)) "
+                "as t (n)",
+                "n",
+            ),
+            ["1", "1", "1", "1", "2", "3", "- null -", "- null -"],
+        ),
+        (
+            apply_sort(
+                "select * from (values (1), (null), (2), (2), (2), (3)) as t (n)",
+                "n",
+                True,
+            ),
+            ["- null -", "3", "2", "2", "2", "1"],
+        ),
+        # Sort columns that cannot be used as a key are paged using an offset
+        (
+            apply_sort(
+                "select * from (values (1, 1.0::float8), (2, 'NaN'), (3, 'NaN'), "
+                "(4, 'NaN'), (5, 'NaN'), (6, 2.0)) as t (id, f)",
+                "f",
+            ),
+            ["1", "6", "2", "3", "4", "5"],
+        ),
+        (
+            apply_sort(
+                "select * from (values (1, '\\x01'::bytea), (2, '\\x02'::bytea), "
+                "(3, '\\x03'::bytea), (4, '\\x04'::bytea)) as t (id, b)",
+                "b",
+            ),
+            ["1", "2", "3", "4"],
+        ),
+        (
+            apply_sort(
+                "select * from (values (1, array[1]), (2, array[2]), (3, array[3]), "
+                "(4, array[4])) as t (id, a)",
+                "a",
+            ),
+            ["1", "2", "3", "4"],
+        ),
+    ),
+)
+def test_next_page_links(admin_client, dashboard_db, settings, sql, expected):
+    settings.DASHBOARD_ROW_LIMIT = 2
+    url = "/dashboard/?" + urllib.parse.urlencode({"sql": sign_sql(sql)})
+    assert _follow_pages(admin_client, url) == expected
+
+
+def test_next_page_links_saved_dashboard(client, saved_dashboard, settings):
+    settings.DASHBOARD_ROW_LIMIT = 2
+    saved_dashboard.queries.all().delete()
+    saved_dashboard.queries.create(sql="select * from generate_series(1, 5)")
+    response = client.get("/dashboard/test/")
+    soup = BeautifulSoup(response.content, "html5lib")
+    assert soup.find("a", string="next page")["href"].startswith(
+        "/dashboard/test/?_page_0="
+    )
+    assert _follow_pages(client, "/dashboard/test/") == ["1", "2", "3", "4", "5"]
+
+
+def test_next_page_invalid_token(admin_client, dashboard_db):
+    response = admin_client.get(
+        "/dashboard/?"
+        + urllib.parse.urlencode({"sql": sign_sql("select 1"), "_page_0": "bad"})
+    )
+    assert b"Invalid page token" in response.content
+
+
+@pytest.mark.parametrize("limit_in_sql", (True, False))
+def test_row_limit_in_sql(dashboard_db, settings, limit_in_sql):
+    settings.DASHBOARD_LIMIT_IN_SQL = limit_in_sql
+    sqls = [
+        "select * from generate_series(1, 1000) -- comment",
+        "explain select 1",
+        "select * from not_a_table",
+        "with d as (delete from django_sql_dashboard_dashboard returning id) "
+        "select * from d",
+    ]
+    with CaptureQueriesContext(connections["dashboard"]) as captured:
+        outcomes = execute_queries("dashboard", sqls, {}, 10)
+    executed = [q["sql"] for q in captured]
+    assert (limit_sql(sqls[0], 11) in executed) == limit_in_sql
+    assert (sqls[0] in executed) != limit_in_sql
+    assert [row[0] for row in outcomes[0]["rows"]] == list(range(1, 11))
+    assert outcomes[0]["truncated"]
+    # Statements that cannot be wrapped, and errors, use the SQL as written
+    assert sqls[1] in executed
+    assert outcomes[1]["rows"][0][0].startswith("Result")
+    assert "LINE 1: select * from not_a_table" in str(outcomes[2])
+    # Including a data-modifying WITH, which cannot be used as a subquery
+    assert "in a read-only transaction" in str(outcomes[3])
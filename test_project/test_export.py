@@ -1,4 +1,17 @@
+import io
+import json
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+
 import pytest
+from bs4 import BeautifulSoup
+from django.core.cache import cache
+from django.db import connections
+from django.db.utils import DatabaseError
+
+from django_sql_dashboard.views import RunningQueries, stream_copy_export
 
 
 def test_export_requires_setting(admin_client, dashboard_db):
@@ -85,3 +98,398 @@ def test_export_json(admin_client, saved_dashboard, settings, json_disabled):
             {"sql": "select 22 + 55", "rows": [{"?column?": 77}]},
         ],
     }
+
+
+def _streamed_json(response):
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/json"
+    return json.loads(b"".join(response.streaming_content))
+
+
+def test_export_query_json_streams_full_results(client, saved_dashboard, settings):
+    settings.DASHBOARD_ROW_LIMIT = 10
+    settings.DASHBOARD_EXPORT_FETCH_SIZE = 7
+    saved_dashboard.queries.create(
+        sql="select n, 'row ' || n as label from generate_series(1, %(max)s::int) as n"
+    )
+    response = client.get("/dashboard/test/2.json?max=50")
+    assert response.streaming
+    assert b"\n" not in b"".join(response.streaming_content)
+    data = _streamed_json(client.get("/dashboard/test/2.json?max=50"))
+    assert data["title"] == "Test dashboard"
+    assert data["columns"] == ["n", "label"]
+    # Not capped by DASHBOARD_ROW_LIMIT
+    assert len(data["rows"]) == 50
+    assert data["rows"][-1] == {"n": 50, "label": "row 50"}
+    assert data["next"] is None
+    assert data["next_url"] is None
+    assert _streamed_json(client.get("/dashboard/test/0.json")) == {
+        "title": "Test dashboard",
+        "sql": "select 11 + 33",
+        "columns": ["?column?"],
+        "rows": [{"?column?": 44}],
+        "next": None,
+        "next_url": None,
+    }
+
+
+def test_export_query_json_non_finite_floats(client, saved_dashboard):
+    saved_dashboard.queries.create(
+        sql="select 'NaN'::float8 as nan, '-Infinity'::float8 as inf, 1.5::float8 as x"
+    )
+    body = b"".join(client.get("/dashboard/test/2.json").streaming_content)
+    # Strict parsers reject the NaN and Infinity tokens json.dumps() writes
+    data = json.loads(body, parse_constant=lambda constant: 1 / 0)
+    assert data["rows"] == [{"nan": None, "inf": None, "x": 1.5}]
+
+
+def test_export_query_json_pagination(client, saved_dashboard):
+    saved_dashboard.queries.create(sql="select * from generate_series(1, 25) as n")
+    url = "/dashboard/test/2.json?_size=10"
+    pages = []
+    while url:
+        data = _streamed_json(client.get(url))
+        pages.append([row["n"] for row in data["rows"]])
+        url = data["next_url"]
+    assert pages == [
+        list(range(1, 11)),
+        list(range(11, 21)),
+        list(range(21, 26)),
+    ]
+    response = client.get("/dashboard/test/2.json?_size=10&_next=10")
+    assert response.status_code == 400
+    assert response.json() == {"error": "Invalid _next token"}
+    assert client.get("/dashboard/test/2.json?_size=0").status_code == 400
+
+
+@pytest.mark.parametrize(
+    "path,status",
+    (
+        ("/dashboard/test/5.json", 404),
+        ("/dashboard/test/2.json", 400),
+        ("/dashboard/missing/0.json", 404),
+    ),
+)
+def test_export_query_json_errors(client, saved_dashboard, path, status):
+    saved_dashboard.queries.create(sql="select * from not_a_table")
+    response = client.get(path)
+    assert response.status_code == status
+    if status == 400:
+        assert "does not exist" in response.json()["error"]
+
+
+def test_export_query_json_permissions(client, saved_dashboard, settings):
+    saved_dashboard.view_policy = "loggedin"
+    saved_dashboard.save()
+    assert client.get("/dashboard/test/0.json").status_code == 403
+    saved_dashboard.view_policy = "public"
+    saved_dashboard.save()
+    settings.DASHBOARD_DISABLE_JSON = True
+    assert client.get("/dashboard/test/0.json").status_code == 403
+
+
+@pytest.mark.parametrize(
+    "format,expected_start,expected_end",
+    (
+        (
+            "csv",
+            b"label,generate_series\nhello,0\nhello,1\nhello,2\n",
+            b"hello,9999\nhello,10000\n",
+        ),
+        (
+            "tsv",
+            b"label\tgenerate_series\nhello\t0\nhello\t1\nhello\t2\n",
+            b"hello\t9999\nhello\t10000\n",
+        ),
+    ),
+)
+def test_export_using_copy(
+    admin_client, dashboard_db, settings, format, expected_start, expected_end
+):
+    settings.DASHBOARD_ENABLE_FULL_EXPORT = True
+    settings.DASHBOARD_EXPORT_USE_COPY = True
+    response = admin_client.post(
+        "/dashboard/",
+        {
+            "sql": "SELECT %(label)s as label, * FROM generate_series(0, 10000) -- comment",
+            "label": "hello",
+            "export_{}_0".format(format): "1",
+        },
+    )
+    chunks = list(response.streaming_content)
+    body = b"".join(chunks)
+    assert body.startswith(expected_start)
+    assert body.endswith(expected_end)
+    # Streamed in a small number of large chunks
+    assert 1 < len(chunks) < 10
+    assert response["Content-Disposition"].endswith('.{}"'.format(format))
+
+
+def test_export_using_copy_closed_early(admin_client, settings):
+    settings.DASHBOARD_ENABLE_FULL_EXPORT = True
+    settings.DASHBOARD_EXPORT_USE_COPY = True
+    # No statement timeout, and a query that would take a long time to finish
+    settings.DATABASES["dashboard"]["OPTIONS"] = {}
+    response = admin_client.post(
+        "/dashboard/",
+        {
+            "sql": "SELECT 'hello' as label, a FROM generate_series(0, 100000) a, generate_series(0, 100000) b",
+            "export_csv_0": "1",
+        },
+    )
+    start = time.perf_counter()
+    chunks = iter(response.streaming_content)
+    assert next(chunks).startswith(b"label,a\nhello,0\n")
+    # Closing the response cancels the COPY instead of waiting for it to finish
+    response.close()
+    assert time.perf_counter() - start < 5
+
+
+def test_export_using_copy_is_read_only(db, settings):
+    # Without the read-only connection options used by the dashboard_db fixture
+    settings.DATABASES["dashboard"]["OPTIONS"] = {}
+    connection = connections["dashboard"]
+    connection.close()
+    with connection.cursor() as cursor:
+        cursor.execute("create table copy_export (id integer)")
+        cursor.execute("insert into copy_export values (1), (2)")
+    try:
+        with pytest.raises(DatabaseError) as e:
+            list(
+                stream_copy_export(
+                    "dashboard", "delete from copy_export returning id", {}, "csv"
+                )
+            )
+        assert "read-only transaction" in str(e.value)
+        with connection.cursor() as cursor:
+            cursor.execute("select count(*) from copy_export")
+            assert cursor.fetchone() == (2,)
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("drop table copy_export")
+        connection.close()
+
+
+def test_export_using_copy_can_be_cancelled(admin_user, db, settings):
+    cache.clear()
+    settings.DATABASES["dashboard"]["OPTIONS"] = {}
+    running_queries = RunningQueries(admin_user.pk)
+    errors = []
+
+    def export():
+        try:
+            list(
+                stream_copy_export(
+                    "dashboard", "select pg_sleep(10)", {}, "csv", None, running_queries
+                )
+            )
+        except DatabaseError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=export)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while not running_queries.all():
+        assert time.monotonic() < deadline, "Timed out waiting for the export"
+        time.sleep(0.01)
+    assert running_queries.cancel() == 1
+    thread.join()
+    assert "canceling statement due to user request" in str(errors[0])
+    assert running_queries.all() == {}
+
+
+def test_export_using_copy_timeout(db, settings):
+    settings.DATABASES["dashboard"]["OPTIONS"] = {}
+    with pytest.raises(DatabaseError) as e:
+        list(stream_copy_export("dashboard", "select pg_sleep(10)", {}, "csv", 50))
+    assert "statement timeout" in str(e.value)
+
+
+@pytest.mark.parametrize(
+    "chunk_size,fetch_size,expected_chunks",
+    (
+        # Defaults: 64KB chunks, 2000 rows at a time
+        (None, None, 2),
+        # Yield after every batch of rows
+        (1, 1000, 11),
+        (1, 5000, 3),
+    ),
+)
+def test_export_chunk_and_fetch_size(
+    admin_client, dashboard_db, settings, chunk_size, fetch_size, expected_chunks
+):
+    settings.DASHBOARD_ENABLE_FULL_EXPORT = True
+    settings.DASHBOARD_EXPORT_CHUNK_SIZE = chunk_size
+    settings.DASHBOARD_EXPORT_FETCH_SIZE = fetch_size
+    response = admin_client.post(
+        "/dashboard/",
+        {
+            "sql": "SELECT 'hello' as label, * FROM generate_series(0, 10000)",
+            "export_csv_0": "1",
+        },
+    )
+    chunks = list(response.streaming_content)
+    assert len(chunks) == expected_chunks
+    body = b"".join(chunks)
+    assert body.startswith(b"label,generate_series\r\nhello,0\r\n")
+    assert body.endswith(b"hello,9999\r\nhello,10000\r\n")
+    assert body.count(b"\r\n") == 10002
+
+
+EXPORT_TYPES_SQL = """
+select
+  n::int4 as id,
+  'row ' || n as label,
+  (n * 1.5)::numeric(6, 2) as amount,
+  mod(n, 2) = 0 as even,
+  date '2021-01-01' + n as day,
+  json_build_object('n', n) as data
+from generate_series(1, 3000) as n
+"""
+
+
+def _export(admin_client, settings, format):
+    settings.DASHBOARD_ENABLE_FULL_EXPORT = True
+    response = admin_client.post(
+        "/dashboard/", {"sql": EXPORT_TYPES_SQL, "export_{}_0".format(format): "1"}
+    )
+    assert response.status_code == 200
+    return response
+
+
+def test_export_ndjson(admin_client, dashboard_db, settings):
+    response = _export(admin_client, settings, "ndjson")
+    assert response["Content-Type"] == "application/x-ndjson"
+    assert response["Content-Disposition"].endswith('.ndjson"')
+    lines = b"".join(response.streaming_content).decode("utf-8").split("\n")
+    assert lines[-1] == ""
+    assert len(lines) == 3001
+    assert json.loads(lines[0]) == {
+        "id": 1,
+        "label": "row 1",
+        "amount": "1.50",
+        "even": False,
+        "day": "2021-01-02",
+        "data": {"n": 1},
+    }
+
+
+def test_export_ndjson_non_finite_floats(admin_client, dashboard_db, settings):
+    settings.DASHBOARD_ENABLE_FULL_EXPORT = True
+    sql = (
+        "select 'NaN'::float8 as nan, 'Infinity'::float8 as inf, "
+        "array[1.5, '-Infinity']::float8[] as floats, 'NaN'::numeric as num"
+    )
+    response = admin_client.post("/dashboard/", {"sql": sql, "export_ndjson_0": "1"})
+    line = b"".join(response.streaming_content).decode("utf-8").strip()
+    # Strict parsers reject the NaN and Infinity tokens json.dumps() writes
+    assert json.loads(line, parse_constant=lambda constant: 1 / 0) == {
+        "nan": None,
+        "inf": None,
+        "floats": [1.5, None],
+        "num": "NaN",
+    }
+
+
+@pytest.mark.parametrize("format", ("arrow", "parquet"))
+def test_export_arrow_and_parquet(admin_client, dashboard_db, settings, format):
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+
+    response = _export(admin_client, settings, format)
+    assert response["Content-Disposition"].endswith('.{}"'.format(format))
+    chunks = list(response.streaming_content)
+    # One chunk per batch of rows fetched from the database
+    assert len(chunks) > 2
+    body = io.BytesIO(b"".join(chunks))
+    if format == "arrow":
+        assert response["Content-Type"] == "application/vnd.apache.arrow.stream"
+        table = pyarrow.ipc.open_stream(body).read_all()
+    else:
+        assert response["Content-Type"] == "application/vnd.apache.parquet"
+        table = pyarrow.parquet.read_table(body)
+    assert table.num_rows == 3000
+    assert [(field.name, str(field.type)) for field in table.schema] == [
+        ("id", "int32"),
+        ("label", "string"),
+        ("amount", "decimal128(6, 2)"),
+        ("even", "bool"),
+        ("day", "date32[day]"),
+        ("data", "string"),
+    ]
+    assert table.slice(0, 1).to_pylist() == [
+        {
+            "id": 1,
+            "label": "row 1",
+            "amount": Decimal("1.50"),
+            "even": False,
+            "day": date(2021, 1, 2),
+            "data": '{"n": 1}',
+        }
+    ]
+
+
+@pytest.mark.parametrize("format", ("arrow", "parquet"))
+def test_export_arrow_and_parquet_nan_and_arrays(
+    admin_client, dashboard_db, settings, format
+):
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+
+    settings.DASHBOARD_ENABLE_FULL_EXPORT = True
+    sql = (
+        "select * from (values (1, 1.5::numeric(6, 2), array[1, 2], "
+        "array['2021-01-02'::date]), (2, 'NaN'::numeric(6, 2), null, "
+        "array[]::date[])) as t (id, amount, numbers, days)"
+    )
+    response = admin_client.post(
+        "/dashboard/", {"sql": sql, "export_{}_0".format(format): "1"}
+    )
+    body = io.BytesIO(b"".join(response.streaming_content))
+    if format == "arrow":
+        table = pyarrow.ipc.open_stream(body).read_all()
+    else:
+        table = pyarrow.parquet.read_table(body)
+    assert table.to_pylist() == [
+        {
+            "id": 1,
+            "amount": Decimal("1.50"),
+            "numbers": "[1, 2]",
+            "days": '["2021-01-02"]',
+        },
+        {"id": 2, "amount": None, "numbers": None, "days": "[]"},
+    ]
+
+
+def test_export_unsupported_format(admin_client, dashboard_db, settings):
+    settings.DASHBOARD_ENABLE_FULL_EXPORT = True
+    response = admin_client.post(
+        "/dashboard/", {"sql": "select 1", "export_xml_0": "1"}
+    )
+    assert response.status_code == 400
+
+
+def test_export_buttons(admin_client, dashboard_db, settings):
+    settings.DASHBOARD_ENABLE_FULL_EXPORT = True
+    response = admin_client.post("/dashboard/", {"sql": "select 1"}, follow=True)
+    html = response.content.decode("utf-8")
+    for name, label in (("csv", "CSV"), ("tsv", "TSV"), ("ndjson", "NDJSON")):
+        assert (
+            'name="export_{}_0"\n          value="Export all as {}"'.format(name, label)
+            in html
+        )
+
+
+def test_truncated_results_export_buttons(admin_client, dashboard_db, settings):
+    settings.DASHBOARD_ENABLE_FULL_EXPORT = True
+    settings.DASHBOARD_ROW_LIMIT = 2
+    response = admin_client.post(
+        "/dashboard/", {"sql": "select * from generate_series(1, 5)"}, follow=True
+    )
+    soup = BeautifulSoup(response.content, "html5lib")
+    # The same formats as the export buttons below the results
+    truncated = [button["name"] for button in soup.select("p.results-truncated input")]
+    assert "export_ndjson_0" in truncated
+    assert truncated == [
+        button["name"] for button in soup.select(".export-buttons input")
+    ]
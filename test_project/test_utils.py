@@ -1,6 +1,30 @@
+import datetime
+import decimal
+import json
+import threading
+import time
+import uuid
+from unittest import mock
+
 import pytest
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
 
-from django_sql_dashboard.utils import apply_sort, is_valid_base64_json
+from django_sql_dashboard import utils
+from django_sql_dashboard.templatetags import django_sql_dashboard as tags
+from django_sql_dashboard.templatetags.django_sql_dashboard import format_cell
+from django_sql_dashboard.utils import (
+    JSONCell,
+    QueryResult,
+    Row,
+    SingleFlight,
+    apply_sort,
+    displayable_rows,
+    is_valid_base64_json,
+    next_page,
+    paginate_sql,
+    postgresql_reserved_words,
+)
 
 
 @pytest.mark.parametrize(
@@ -50,3 +74,261 @@ def test_is_valid_base64_json(input, expected):
 )
 def test_apply_sort(sql, sort_column, is_desc, expected_sql):
     assert apply_sort(sql, sort_column, is_desc) == expected_sql
+
+
+@pytest.mark.parametrize(
+    "sql,page,rows,expected_page",
+    (
+        # Unsorted queries are paged using an offset
+        ("select * from t", None, [[1], [2]], {"offset": 2}),
+        ("select * from t", {"offset": 2}, [[3], [4]], {"offset": 4}),
+        # Sorted queries record the last value and how often it was seen
+        (
+            'select * from t order by "id"',
+            None,
+            [[1], [2], [2]],
+            {"offset": 3, "key": 2, "ties": 2},
+        ),
+        (
+            'select * from t order by "id" desc',
+            {"offset": 3, "key": 2, "ties": 2},
+            [[2], [2], [2]],
+            {"offset": 6, "key": 2, "ties": 5},
+        ),
+        (
+            'select * from t order by "id"',
+            {"offset": 3, "key": 2, "ties": 2},
+            [[2], [3], [3]],
+            {"offset": 6, "key": 3, "ties": 2},
+        ),
+        # Nulls and unknown columns fall back to the offset
+        ('select * from t order by "id"', None, [[1], [None]], {"offset": 2}),
+        ('select * from t order by "other"', None, [[1], [2]], {"offset": 2}),
+    ),
+)
+def test_next_page(sql, page, rows, expected_page):
+    assert next_page(sql, page, ["id"], [23], rows) == expected_page
+
+
+@pytest.mark.parametrize(
+    "type_code,value,expected_page",
+    (
+        (
+            1082,
+            datetime.date(2021, 1, 2),
+            {"offset": 1, "key": "2021-01-02", "ties": 1},
+        ),
+        (
+            2950,
+            uuid.UUID(int=1),
+            {"offset": 1, "key": str(uuid.UUID(int=1)), "ties": 1},
+        ),
+        # bytea and arrays do not survive being passed back as a string
+        (17, memoryview(b"\x01"), {"offset": 1}),
+        (1007, [1, 2], {"offset": 1}),
+        # NaN sorts after every other value, so cannot be used as a key
+        (701, 1.5, {"offset": 1, "key": 1.5, "ties": 1}),
+        (701, float("nan"), {"offset": 1}),
+        (1700, decimal.Decimal("NaN"), {"offset": 1}),
+    ),
+)
+def test_next_page_key_types(type_code, value, expected_page):
+    sql = 'select * from t order by "id"'
+    assert next_page(sql, None, ["id"], [type_code], [[value]]) == expected_page
+
+
+@pytest.mark.parametrize(
+    "sql,page,expected_sql,expected_params",
+    (
+        (
+            "select * from t",
+            {"offset": 20},
+            "select * from (select * from t\n) as results limit 11 offset 20",
+            {},
+        ),
+        (
+            'select * from t order by "id"',
+            {"offset": 20, "key": 5, "ties": 2},
+            'select * from (select * from t\n) as results where ("id" >= %(k)s '
+            'or "id" is null) order by "id" limit 11 offset 2',
+            {"k": 5},
+        ),
+        (
+            'select * from t order by "id" desc',
+            {"offset": 20, "key": 5, "ties": 0},
+            'select * from (select * from t\n) as results where "id" <= %(k)s '
+            'order by "id" desc limit 11 offset 0',
+            {"k": 5},
+        ),
+    ),
+)
+def test_paginate_sql(sql, page, expected_sql, expected_params):
+    assert paginate_sql(sql, page, 11, "k") == (expected_sql, expected_params)
+
+
+def test_displayable_rows():
+    raw_rows = [(1, "a", "b"), (2, {"x": 1}, [1, 2])]
+    rows = displayable_rows(raw_rows, ["id", "name", "name"])
+    # Rows share their column mapping, and only copy values that change
+    assert rows[0].columns is rows[1].columns
+    assert rows[0].values is raw_rows[0]
+    assert list(rows[1]) == [2, '{"x": 1}', "[1, 2]"]
+    assert isinstance(rows[1][1], JSONCell)
+    assert rows[1][1].value == {"x": 1}
+    # Accessible by index or name, with later duplicate names winning
+    assert rows[0][0] == 1
+    assert rows[0][1:] == ("a", "b")
+    assert rows[0]["name"] == "b"
+    assert len(rows[0]) == 3
+    assert rows[0].as_dict() == dict(zip(["id", "name", "name"], raw_rows[0]))
+    assert repr(rows[0]) == '{"id": 1, "name": "b"}'
+    with pytest.raises(KeyError):
+        rows[0]["missing"]
+
+
+def test_displayable_rows_type_codes():
+    raw_rows = [(1, {"x": 1}, {"y": 2})]
+    # Only columns that are not known to be scalar types are checked
+    rows = displayable_rows(raw_rows, ["id", "text", "jsonb"], [23, 25, 3802])
+    assert list(rows[0]) == [1, {"x": 1}, '{"y": 2}']
+    rows = displayable_rows(raw_rows, ["id", "text", "jsonb"], [23, 25, 25])
+    assert rows[0].values is raw_rows[0]
+
+
+def test_format_cell_json_cell():
+    assert format_cell(JSONCell({"x": [1, 2]})) == (
+        '<pre class="json">{\n  &quot;x&quot;: [\n    1,\n    2\n  ]\n}</pre>'
+    )
+
+
+@pytest.mark.parametrize(
+    "value,expected,calls_urlize,calls_json_loads",
+    (
+        (1, "1", False, False),
+        (datetime.date(2021, 1, 1), "2021-01-01", False, False),
+        ("a <b>", "a &lt;b&gt;", False, False),
+        ("{not json", "{not json", False, True),
+        ("[1]", '<pre class="json">[\n  1\n]</pre>', False, True),
+        ("1.5. No links here: none", "1.5. No links here: none", False, False),
+        (
+            "example.com",
+            '<a href="http://example.com" rel="nofollow">example.com</a>',
+            True,
+            False,
+        ),
+        (
+            "see http://localhost",
+            'see <a href="http://localhost" rel="nofollow">http://localhost</a>',
+            True,
+            False,
+        ),
+    ),
+)
+def test_format_cell_skips_work(value, expected, calls_urlize, calls_json_loads):
+    # Guards the fast paths: urlize() and json.loads() are slow, so should
+    # only be called for strings that could contain a link or JSON
+    with mock.patch.object(tags, "urlize", wraps=tags.urlize) as urlize, mock.patch(
+        "json.loads", wraps=json.loads
+    ) as json_loads:
+        assert format_cell(value) == expected
+    assert urlize.called == calls_urlize
+    assert json_loads.called == calls_json_loads
+
+
+def test_markup_filters_are_memoized():
+    tags._markdown.cache_clear()
+    tags._bleach.cache_clear()
+    for _ in range(3):
+        assert tags.sql_dashboard_markdown("Hello *world* http://example.com/") == (
+            '<p>Hello <em>world</em> <a href="http://example.com/" '
+            'rel="nofollow">http://example.com/</a></p>'
+        )
+        assert tags.sql_dashboard_bleach("<b>hi</b><script>x</script>") == (
+            "<b>hi</b>&lt;script&gt;x&lt;/script&gt;"
+        )
+    assert tags._markdown.cache_info().hits == 2
+    assert tags._bleach.cache_info().hits == 2
+
+
+def test_markup_filters_use_an_instance_per_thread():
+    tags.sql_dashboard_bleach("main thread")
+    cleaners = [tags._local.cleaner]
+    thread = threading.Thread(
+        target=lambda: (
+            tags.sql_dashboard_bleach("other thread"),
+            cleaners.append(tags._local.cleaner),
+        )
+    )
+    thread.start()
+    thread.join()
+    assert cleaners[0] is not cleaners[1]
+    assert tags._local.cleaner is cleaners[0]
+
+
+def test_query_result_builds_rows_when_used():
+    result = QueryResult({"row_lists": [Row((1, "a"), ["id", "name"])]})
+    assert "rows" not in result
+    assert result["rows"] == [{"id": 1, "name": "a"}]
+    assert result["rows"] is result["rows"]
+    with pytest.raises(KeyError):
+        result["missing"]
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    single_flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return len(calls)
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(single_flight.do("k", slow)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert results == [1] * 5
+    # Once finished the next call runs again
+    assert single_flight.do("k", slow) == 2
+
+
+def test_single_flight_shares_exceptions():
+    single_flight = SingleFlight()
+    with pytest.raises(ValueError):
+        single_flight.do("k", lambda: int("x"))
+    assert single_flight.do("k", lambda: 1) == 1
+
+
+def test_postgresql_reserved_words(dashboard_db):
+    connection = connections["dashboard"]
+    # Connecting warms the cache, so do that before clearing it
+    connection.ensure_connection()
+    utils._reserved_words.clear()
+    with CaptureQueriesContext(connection) as first:
+        reserved_words = postgresql_reserved_words(connection)
+    assert isinstance(reserved_words, frozenset)
+    assert {"select", "order", "user"} <= reserved_words
+    assert "name" not in reserved_words
+    assert len(first) == 1
+    # Cached for this alias and server version
+    assert ("dashboard", connection.pg_version) in utils._reserved_words
+    with CaptureQueriesContext(connection) as second:
+        assert postgresql_reserved_words(connection) is reserved_words
+    assert len(second) == 0
+
+
+def test_reserved_words_warmed_on_connect(dashboard_db):
+    connection = connections["dashboard"]
+    connection.close()
+    utils._reserved_words.clear()
+    connection.ensure_connection()
+    assert list(utils._reserved_words) == [("dashboard", connection.pg_version)]
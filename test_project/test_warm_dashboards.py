@@ -0,0 +1,42 @@
+from io import StringIO
+
+import pytest
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+
+def warm(*args):
+    stdout = StringIO()
+    call_command("warm_dashboards", *args, stdout=stdout)
+    return stdout.getvalue()
+
+
+def test_warm_dashboards(client, saved_dashboard):
+    cache.clear()
+    saved_dashboard.cache_ttl = 60
+    saved_dashboard.save()
+    saved_dashboard.queries.create(sql="select %(name)s as name")
+    output = warm("--concurrency", "2")
+    assert output.startswith("test: 3 queries, 0 errors, ")
+    assert "Warmed 1 dashboard in " in output
+    with CaptureQueriesContext(connections["dashboard"]) as captured:
+        response = client.get("/dashboard/test/")
+    assert not any(q["sql"] == "select 11 + 33" for q in captured)
+    assert b"Cached results computed" in response.content
+    assert b"44" in response.content
+
+
+def test_warm_dashboards_ignores_dashboards_without_cache_ttl(saved_dashboard):
+    assert warm().startswith("Warmed 0 dashboards in ")
+    with pytest.raises(CommandError):
+        warm("test")
+
+
+def test_warm_dashboards_timeout(saved_dashboard):
+    saved_dashboard.cache_ttl = 60
+    saved_dashboard.save()
+    saved_dashboard.queries.create(sql="select pg_sleep(1)")
+    output = warm("test", "--timeout", "20")
+    assert output.startswith("test: 3 queries, 1 error, ")
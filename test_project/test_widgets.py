@@ -1,3 +1,4 @@
+import json
 from urllib.parse import parse_qsl
 
 import pytest
@@ -31,6 +32,38 @@ def test_default_widget(admin_client, dashboard_db):
     )
 
 
+def test_default_widget_render_in_browser(admin_client, dashboard_db, settings):
+    settings.DASHBOARD_CLIENT_RENDER_ROWS = 2
+    response = admin_client.post(
+        "/dashboard/",
+        {
+            "sql": [
+                "select 1 as id, 'one' as name, null as size",
+                "select * from (values (1, 'a\tb'), (2, null), (3, '{\"x\": 1}')) "
+                "as t (id, name)",
+            ]
+        },
+        follow=True,
+    )
+    html = response.content.decode("utf-8")
+    soup = BeautifulSoup(html, "html5lib")
+    # Below the threshold the rows are rendered by the server
+    assert soup.select("#query-results-0 tbody tr")
+    assert not soup.select("#rows-0")
+    assert soup.select("textarea#copyable-0")[0].text == "id\tname\tsize\n1\tone"
+    # Above it they are sent once as JSON, without a server-side TSV copy
+    assert not soup.select("#query-results-1 tbody tr")
+    tbody = soup.select("#query-results-1 tbody")[0]
+    assert tbody["data-rows-id"] == "rows-1"
+    assert tbody["data-copyable-id"] == "copyable-1"
+    assert json.loads(soup.select("script#rows-1")[0].string) == {
+        "columns": ["id", "name"],
+        "rows": [["1", "a\tb"], ["2", None], ["3", '{"x": 1}']],
+    }
+    assert soup.select("textarea#copyable-1")[0].text == ""
+    assert "3 rows" in soup.select("#query-results-1")[0].text
+
+
 def test_default_widget_pretty_prints_json(admin_client, dashboard_db):
     response = admin_client.post(
         "/dashboard/",